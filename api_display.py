@@ -8,14 +8,14 @@ from subprocess import check_output
 
 from joedisplay import get_device, StageController
 from joedisplay.api import create_api
-from joedisplay.stages import MetricsStage
+from joedisplay.stages import MetricsStage, AnimationStage, FrameStage
 from transport.stages import TrainDepartureBoardStage
 
 """
 Display exposed as an HTTP endpoint. Will render any `Stage` registered within the controller.
 
-Any stage registered below with `add_stage` will work. Draw will block the request, unless the stage
-implementation runs in its own thread.
+Any stage registered below with `add_stage` will work. Events are queued and the request returns
+straight away. A 503 is returned if the display is too far behind to accept more.
 
 curl -X POST \
   http://192.168.1.35:5000/display \
@@ -49,6 +49,9 @@ term.flush()
 controller = StageController(device)
 controller.add_stage(TrainDepartureBoardStage)
 controller.add_stage(MetricsStage)
+controller.add_stage(AnimationStage)
+controller.add_stage(FrameStage)
+controller.preload_fonts()
 
 api = create_api("example_display_api", controller)
 
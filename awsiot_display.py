@@ -3,12 +3,12 @@ import sys
 import os
 import json
 import time
-from luma.core.virtual import terminal
 
 from dotenv import load_dotenv
-from joedisplay import get_device, StageController, IoTDisplayDriver
+from joedisplay import get_device, StageController
+from joedisplay.iot_driver import IoTDisplayDriver, RefreshPolicy
 from transport.stages import TrainDepartureBoardStage
-from joedisplay.stages import MetricsStage
+from joedisplay.stages import MetricsStage, AnimationStage, FrameStage
 
 load_dotenv()
 
@@ -26,13 +26,24 @@ if __name__ == "__main__":
     controller = StageController(device)
     controller.add_stage(TrainDepartureBoardStage)
     controller.add_stage(MetricsStage)
+    controller.add_stage(AnimationStage)
+    controller.add_stage(FrameStage)
+    controller.preload_fonts()
+    controller.prewarm([TrainDepartureBoardStage.NAME, MetricsStage.NAME])
 
-    term = terminal(device, None)
-    term.println('*** joedisplay ***')
+    def show_text(text):
+        # Boot messages are all kept (not coalesced) and shown without animating
+        controller.submit({'stage': 'text', 'message': text, 'animate': False, 'coalesce': False})
+
+    show_text('*** joedisplay ***')
+
+    # e.g. QUIET_HOURS=1-5 to stop asking for data between 01:00 and 05:00 local time
+    quiet_hours = os.getenv("QUIET_HOURS")
+    policy = RefreshPolicy(quiet_hours=tuple(int(h) for h in quiet_hours.split('-')) if quiet_hours else None)
 
     driver = IoTDisplayDriver(client_id, display_topic, os.getenv(
-        "AWS_IOT_ENDPOINT"), os.getenv("CA"), os.getenv("KEY"), os.getenv("CERT"), controller)
-    driver.register_text_updates_callback(term.println)
+        "AWS_IOT_ENDPOINT"), os.getenv("CA"), os.getenv("KEY"), os.getenv("CERT"), controller, policy)
+    driver.register_text_updates_callback(show_text)
 
     driver.start()
 
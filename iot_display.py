@@ -9,7 +9,7 @@ from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTClient
 from dotenv import load_dotenv
 from joedisplay import get_device, StageController
 from transport.stages import TrainDepartureBoardStage
-from joedisplay.stages import MetricsStage
+from joedisplay.stages import MetricsStage, AnimationStage, FrameStage
 
 """
 Demo MQTT driver
@@ -45,11 +45,14 @@ term.flush()
 controller = StageController(device)
 controller.add_stage(TrainDepartureBoardStage)
 controller.add_stage(MetricsStage)
+controller.add_stage(AnimationStage)
+controller.add_stage(FrameStage)
+controller.preload_fonts()
 
 if __name__ == "__main__":
     def handler(client, userdata, message):
         event = json.loads(message.payload)
-        controller.event_handler(event, {})
+        controller.submit(event, {})
 
     client = create_mqtt_client()
     client.connect()
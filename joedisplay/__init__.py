@@ -1,7 +1,6 @@
 from .stage import Stage
 from .controller import StageController
 from .device import get_device
-from .iot_driver import IoTDisplayDriver
 
 import logging
 
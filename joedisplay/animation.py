@@ -0,0 +1,124 @@
+import argparse
+import mmap
+import struct
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from .framebuffer import GreyscaleFramebuffer
+
+"""
+Pre-rendered animations for the `animation` stage.
+
+A file is a 16 byte header followed by frames packed the way the SSD1322 takes them: 4-bit greyscale,
+two pixels per byte with the left pixel in the high nibble, rows top to bottom. A 256x64 frame is 8192 bytes.
+
+Header (little-endian): magic `JDA1`, width and height (uint16), frame count (uint32), default fps (uint16)
+and two reserved bytes.
+
+Convert a GIF, or a sequence of PNGs, with:
+
+    python -m joedisplay.animation logo.gif -o animations/logo.jda
+    python -m joedisplay.animation frames/*.png -o animations/spinner.jda --fps 12
+"""
+
+MAGIC = b'JDA1'
+HEADER = struct.Struct('<4sHHIH2x')
+
+
+class AnimationFile(object):
+    """
+    Read-only, memory-mapped animation file. `frame(i)` returns a view of the packed frame in the
+    mapping, so only the pages of frames that are played are ever read from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is empty")
+
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is too short to be an animation")
+        magic, self.width, self.height, self.count, self.fps = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not an animation file")
+
+        self.frame_size = self.width * self.height // 2
+        if len(self._map) < HEADER.size + self.count * self.frame_size:
+            self.close()
+            raise ValueError(f"{path} is truncated")
+
+    def __len__(self):
+        return self.count
+
+    def frame(self, i):
+        return np.frombuffer(self._map, dtype=np.uint8, count=self.frame_size,
+                             offset=HEADER.size + i * self.frame_size)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def fit(image, width, height):
+    """
+    Scale `image` down to fit within width x height, keeping its aspect ratio, centred on black.
+    """
+    image = image.convert('RGB')
+    if image.size != (width, height):
+        image.thumbnail((width, height))
+        frame = Image.new('RGB', (width, height))
+        frame.paste(image, ((width - image.width) // 2, (height - image.height) // 2))
+        image = frame
+    return image
+
+
+def source_frames(paths):
+    """
+    Yields (image, duration in ms or None) for every frame of every file in `paths`.
+    """
+    for path in paths:
+        with Image.open(path) as image:
+            for frame in ImageSequence.Iterator(image):
+                yield frame.copy(), frame.info.get('duration')
+
+
+def convert(paths, output, width=256, height=64, fps=None):
+    """
+    Pack the frames of the images in `paths` into an animation file at `output`.
+    Without `fps`, the frame rate is taken from the first frame's GIF duration, or 10.
+    Frames are written one at a time. Returns the number of frames written.
+    """
+    framebuffer = GreyscaleFramebuffer(width, height)
+    grey = np.empty((height, width), dtype=np.uint8)
+    count = 0
+    with open(output, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, width, height, 0, 0))
+        for image, duration in source_frames(paths):
+            if fps is None:
+                fps = round(1000 / duration) if duration else 10
+            framebuffer.convert(fit(image, width, height), out=grey)
+            f.write(framebuffer.pack(grey).tobytes())
+            count += 1
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, width, height, count, max(1, int(fps or 10))))
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Convert a GIF or PNG sequence into an animation file.')
+    parser.add_argument('images', nargs='+', help='GIF or PNG files, in order')
+    parser.add_argument('-o', '--output', required=True, help='animation file to write')
+    parser.add_argument('--fps', type=int, help='default frame rate (default: from the GIF, or 10)')
+    parser.add_argument('--width', type=int, default=256)
+    parser.add_argument('--height', type=int, default=64)
+    args = parser.parse_args()
+
+    frames = convert(args.images, args.output, args.width, args.height, args.fps)
+    print(f"Wrote {frames} frames to {args.output}")
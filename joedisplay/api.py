@@ -11,7 +11,8 @@ def create_api(name, stage_controller):
 
     @app.route('/display', methods=['POST'])
     def update_stage():
-        stage_controller.event_handler(request.json, {})
-        return jsonify({"status": "ok"})
+        if stage_controller.submit(request.json, {}):
+            return jsonify({"status": "ok"})
+        return make_response(jsonify({"status": "busy"}), 503)
 
     return app
@@ -0,0 +1,87 @@
+from datetime import datetime
+
+from luma.core.virtual import hotspot
+
+from .measure import measure
+from .sprites import sprites
+
+"""
+The HH:MM:SS clock of the train departures board, also drawn by displays over frames rendered without
+it (see `joedisplay.render`), so that it keeps ticking between frames.
+"""
+
+CLOCK_FONT_LARGE = ("Dot Matrix Bold.ttf", 20)
+CLOCK_FONT_TALL = ("Dot Matrix Bold Tall.ttf", 10)
+
+
+class ClockRenderer(hotspot):
+    """
+    Renders the HH:MM:SS clock from digit and colon sprites that are rasterized once.
+    HH:MM uses the large font and :SS the tall font. Each character has a fixed cell, so the clock
+    only redraws when the displayed second changes and then only the cells whose digit changed.
+    """
+    CHARS = '0123456789:'
+    # Font and vertical offset for each character of HH:MM:SS
+    ROLES = ['large'] * 5 + ['tall'] * 3
+    OFFSETS = {'large': 0, 'tall': 5}
+
+    def __init__(self, width, height, large_font, tall_font):
+        super(ClockRenderer, self).__init__(width, height)
+        fonts = {'large': large_font, 'tall': tall_font}
+        self.glyphs = {}
+        glyph_widths = {}
+        for role, f in fonts.items():
+            for ch in self.CHARS:
+                glyph = self.glyphs[(role, ch)] = sprites.rasterize(ch, f, "white")
+                glyph_widths[(role, ch)] = max(measure(ch, f)[0], glyph.width)
+
+        # Digit cells are as wide as the widest digit so the clock doesn't shift as it ticks.
+        # Each glyph is centred in its cell so narrow digits such as 1 don't leave gaps.
+        cell_widths = {}
+        for role in fonts:
+            digits = [glyph_widths[(role, ch)] for ch in '0123456789']
+            cell_widths[role] = (max(digits), glyph_widths[(role, ':')])
+        self.glyph_widths = glyph_widths
+
+        widths = [cell_widths[role][1 if i in (2, 5) else 0]
+                  for i, role in enumerate(self.ROLES)]
+        x = (width - sum(widths)) // 2
+        self.cells = []
+        for role, w in zip(self.ROLES, widths):
+            self.cells.append((role, x, min(x + w, width)))
+            x += w
+
+        self.shown = None
+        self.pending = None
+
+    def should_redraw(self):
+        now = datetime.now().strftime('%H:%M:%S')
+        if now == self.shown:
+            return False
+        self.pending = now
+        return True
+
+    def changed(self):
+        if self.shown is None:
+            return list(range(len(self.cells)))
+        return [i for i, (a, b) in enumerate(zip(self.shown, self.pending)) if a != b]
+
+    def damage(self):
+        if self.shown is None:
+            return None
+        return [(left, 0, right, self.height) for _, left, right in
+                (self.cells[i] for i in self.changed())]
+
+    def paste_into(self, image, xy):
+        x, y = xy
+        if self.shown is None:
+            image.paste("black", (x, y, x + self.width, y + self.height))
+
+        for i in self.changed():
+            role, left, right = self.cells[i]
+            image.paste("black", (x + left, y, x + right, y + self.height))
+            glyph = self.glyphs[(role, self.pending[i])]
+            top = y + self.OFFSETS[role]
+            gx = x + left + (right - left - self.glyph_widths[(role, self.pending[i])]) // 2
+            image.paste("white", (gx, top, gx + glyph.width, top + glyph.height), glyph)
+        self.shown = self.pending
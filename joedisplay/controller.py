@@ -1,19 +1,83 @@
 import logging
+import time
+from collections import OrderedDict, deque
+from threading import RLock, Thread
 
+from .events import EventQueue
+from .helpers import fonts
+from .scheduler import FrameScheduler
 from .stages import TerminalStage
+from .transition import EFFECTS, Transition
 
 logger = logging.getLogger(__name__)
 
 
+class StageCache(object):
+    """
+    Keeps up to `size` stopped stage instances, keyed by stage name, so switching back to a stage
+    resumes it rather than rebuilding its fonts and viewports. The least recently used is evicted.
+    """
+
+    def __init__(self, size=4):
+        self.size = size
+        self._stages = OrderedDict()
+
+    def put(self, stage):
+        self._stages[stage.NAME] = stage
+        self._stages.move_to_end(stage.NAME)
+        while len(self._stages) > self.size:
+            name, _ = self._stages.popitem(last=False)
+            logging.info(f"Evicted stage from cache: {name}")
+
+    def pop(self, name):
+        return self._stages.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self._stages
+
+
 class StageController(object):
     """
     Delegates incoming events sent to `event_handler` to the appropriate stage implementation.
+    Owns the frame scheduler that refreshes the active stage, capped at `fps` frames per second.
+
+    Network threads should use `submit`, which queues the event for a single consumer thread
+    and returns immediately.
+
+    Stopped stages are kept in a `StageCache` of `cache_size` instances.
+
+    A stage switch is a handoff: the controller lock is held while the old stage is stopped and the new
+    one started, and the scheduler only draws while holding the same lock, so the old stage is quiescent
+    before the new one draws. Waiting for an in-flight frame is bounded by `handoff_timeout` seconds,
+    after which the event is put back on the queue. Each switch is appended to `switch_times` as a dict
+    of `stage`, `warm`, `switch` (seconds to stop the old stage and start the new one), `first_frame`
+    (seconds until the first frame after the switch was written to the device, the first frame of the
+    transition if there is one) and `transition` (seconds the transition played for, or `None`).
+
+    Stage switches are hard cuts unless `transition` names one of the effects in `joedisplay.transition`
+    (`wipe`, `slide` or `crossfade`), played over `transition_duration` seconds. An event can choose its
+    own with a `"transition"` property, `null` for a cut. Transitions need a device that can capture frames,
+    such as the `FrameDiffDevice` from `get_device()`.
     """
 
-    def __init__(self, device):
+    def __init__(self, device, fps=40, queue_size=16, cache_size=4, handoff_timeout=2.0,
+                 transition=None, transition_duration=0.5):
         self.stages = {}
         self.device = device
         self.active_stage = None
+        self.stage_cache = StageCache(cache_size)
+        self.switch_times = deque(maxlen=100)
+        self.switch_started = None
+        self.handoff_timeout = handoff_timeout
+        self.transition = transition
+        self.transition_duration = transition_duration
+        self.lock = RLock()
+        self.scheduler = FrameScheduler(fps=fps, lock=self.lock)
+        self.scheduler.start()
+        self.queue = EventQueue(maxsize=queue_size)
+        self.consumer = Thread(target=self._consume,
+                               name='event-consumer', daemon=True)
+        self.consumer.start()
         self.add_stage(TerminalStage)
 
     def add_stage(self, s):
@@ -23,27 +87,149 @@ class StageController(object):
         else:
             logging.error("Did not add stage as it had no NAME set.")
 
+    def preload_fonts(self):
+        """
+        Load the fonts of every registered stage in the background.
+        """
+        needed = []
+        for s in self.stages.values():
+            needed.extend(f for f in s.FONTS if f not in needed)
+        return fonts.preload(needed)
+
+    def submit(self, event, context=None):
+        """
+        Queue a display event. Returns `False` if it was rejected because the queue is full.
+        """
+        accepted = self.queue.offer(event, context)
+        if not accepted:
+            logging.warning("Event queue full, rejected event for stage: %s", event.get('stage'))
+        return accepted
+
+    def _consume(self):
+        while True:
+            event, context = self.queue.take()
+            try:
+                if not self.event_handler(event, context):
+                    self.queue.requeue(event, context)
+            except Exception:
+                logging.exception("Error handling event")
+
     def event_handler(self, event, context):
         """
         Display event handler. Will switch active stage if different to current.
+        Returns `False` if the active stage did not finish drawing within `handoff_timeout`.
         """
+        if not self.lock.acquire(timeout=self.handoff_timeout):
+            logging.error("Timed out waiting for the active stage to finish drawing.")
+            return False
+        try:
+            self._handle(event, context)
+        finally:
+            self.lock.release()
+        self.scheduler.wake()
+        return True
+
+    def _handle(self, event, context):
+        effect = None
+        if 'patch' not in event and self.active_stage is not None and event['stage'] != self.active_stage.NAME:
+            effect = event.get('transition', self.transition)
+            if effect is not None and effect not in EFFECTS:
+                logging.warning(f"Unknown transition: {effect}")
+                effect = None
+        if effect is None or not hasattr(self.device, 'start_capture') or not self.device.start_capture():
+            self._switch_and_handle(event, context)
+            return
+
+        # Draw the incoming stage's first frame into the capture rather than on the display
+        try:
+            self._switch_and_handle(event, context)
+            self.active_stage.refresh()
+        finally:
+            before, after = self.device.end_capture()
+        transition = Transition(self.device, before, after, effect, self.transition_duration,
+                                fps=1.0 / self.scheduler.min_interval)
+        logging.info("Playing %s transition of %d frames (generated in %.1fms)", transition.effect,
+                     len(transition.frames), transition.build_time * 1000)
+
+        switch = self.switch_times[-1]
+        played = time.monotonic()
+
+        def transition_done():
+            switch['transition'] = time.monotonic() - played
+
+        self.scheduler.play(transition, on_done=transition_done)
+
+    def _switch_and_handle(self, event, context):
+        if 'patch' in event:
+            # A patch only makes sense against what the active stage is showing
+            if self.active_stage is not None and event['stage'] == self.active_stage.NAME:
+                self.active_stage.patch(event['patch'], context)
+            else:
+                logging.info(f"Ignoring patch for inactive stage: {event['stage']}")
+            return
+
         if self.active_stage is not None and event['stage'] != self.active_stage.NAME:
             logging.info(
                 "Different stage encountered. Stopping current stage...")
+            self.switch_started = time.monotonic()
+            self.scheduler.set_stage(None)
             self.active_stage.stop()
+            self.stage_cache.put(self.active_stage)
             self.active_stage = None
 
         if self.active_stage is None:
-            next_ctor = self.stages.get(event['stage'], None)
-            if next_ctor is not None:
-                logging.info(f"Creating and starting stage: {event['stage']}")
-                self.active_stage = next_ctor(self.device)
-                self.active_stage.start()
+            if event['stage'] in self.stages:
+                self._activate(event['stage'])
             else:
                 error = f"Invalid stage: {event['stage']} is not registered."
                 logging.error(error)
-                self.active_stage = TerminalStage(self.device)
+                self._activate(TerminalStage.NAME)
                 self.active_stage.handle(
                     {'message': error}, context)
                 return
         self.active_stage.handle(event, context)
+
+    def _activate(self, name):
+        started = self.switch_started or time.monotonic()
+        stage = self.stage_cache.pop(name)
+        warm = stage is not None
+        if warm:
+            logging.info(f"Resuming stage: {name}")
+        else:
+            logging.info(f"Creating and starting stage: {name}")
+            stage = self.stages[name](self.device)
+        stage.start()
+        self.active_stage = stage
+
+        switch = {'stage': name, 'warm': warm,
+                  'switch': time.monotonic() - started, 'first_frame': None, 'transition': None}
+        self.switch_times.append(switch)
+        self.switch_started = None
+        logging.info("Switched to %s in %.1fms (%s)", name,
+                     switch['switch'] * 1000, 'warm' if warm else 'cold')
+
+        def first_frame_drawn():
+            switch['first_frame'] = time.monotonic() - started
+            logging.info("First frame after switching to %s drawn %.1fms after switch started",
+                         name, switch['first_frame'] * 1000)
+
+        self.scheduler.set_stage(stage, on_first_frame=first_frame_drawn)
+
+    def prewarm(self, names):
+        """
+        Construct registered stages ahead of time so the first switch to them is a resume.
+        """
+        with self.lock:
+            for name in names:
+                active = self.active_stage is not None and self.active_stage.NAME == name
+                if active or name in self.stage_cache or name not in self.stages:
+                    continue
+                logging.info(f"Pre-warming stage: {name}")
+                self.stage_cache.put(self.stages[name](self.device))
+
+    def stop(self):
+        self.scheduler.stop()
+        self.scheduler.join(self.handoff_timeout)
+        with self.lock:
+            if self.active_stage is not None:
+                self.active_stage.stop()
@@ -1,8 +1,13 @@
 import sys
 import logging
 
+import numpy as np
+from PIL import Image
 from luma.core import cmdline, error
 
+from .framebuffer import GreyscaleFramebuffer
+from .stats import RateCounter
+
 
 def display_settings(args):
     """
@@ -56,6 +61,189 @@ def _get_device(actual_args=None):
 
 def get_device():
     """
-    Default to the hardware device.
+    Default to the hardware device, wrapped in a `FrameDiffDevice`.
+    luma's own frame buffering is set to full frames as the wrapper keeps track of what changed instead.
+    """
+    return FrameDiffDevice(_get_device(['--display', 'ssd1322', '--width', '256', '--height', '64',
+                                        '--interface', 'spi', '--framebuffer', 'full_frame']))
+
+
+BITS_PER_PIXEL = {'1': 1, 'L': 8, 'RGB': 24, 'RGBA': 32}
+
+
+def supports_windows(device):
+    """
+    Whether `device` accepts a column/row address window, as luma's greyscale OLED devices do.
+    """
+    return hasattr(device, '_set_position') and hasattr(device, '_inflate_bbox')
+
+
+def window_cost(device, box):
+    """
+    (pixels, bytes) it takes to send `box` to `device` if it supports windowed writes.
+    """
+    left, top, right, bottom = device._inflate_bbox(box) if supports_windows(device) else box
+    pixels = (right - left) * (bottom - top)
+    bits = 4 if supports_windows(device) else BITS_PER_PIXEL.get(device.mode, 24)
+    return pixels, pixels * bits // 8
+
+
+def write_window(device, image, box):
+    """
+    Push the `box` region of the full-frame `image` to `device`.
+    A `FrameDiffDevice` (as returned by `get_device()`) sends only the changed window to greyscale OLEDs
+    such as the SSD1322. Other devices (including luma's dummy and emulators) get the full frame.
+    Returns a tuple of (pixels, bytes) sent.
+    """
+    if hasattr(device, 'display_window'):
+        return device.display_window(image, box)
+
+    device.display(image)
+    pixels = device.width * device.height
+    return pixels, pixels * BITS_PER_PIXEL.get(device.mode, 24) // 8
+
+
+def display_greyscale(device, grey):
+    """
+    Show a frame of 4-bit greyscale values (0-15), such as a pre-rendered one.
+    A `FrameDiffDevice` for a greyscale panel takes it as it is. Other devices get it as an image.
+    """
+    if hasattr(device, 'display_frame') and device.framebuffer is not None:
+        device.display_frame(grey)
+    else:
+        device.display(Image.fromarray(grey * 17).convert(device.mode))
+
+
+class FrameDiffDevice(object):
     """
-    return _get_device(['--display', 'ssd1322', '--width', '256', '--height', '64', '--interface', 'spi'])
+    Wraps a luma device and keeps the last frame sent to it as a NumPy array.
+
+    Frames identical to the last one are not sent at all. Otherwise only the bounding window of the
+    changed rows and columns is sent if the device supports windowed writes (the SSD1322 does),
+    or the full frame if it doesn't (e.g. luma's dummy device).
+
+    For windowed greyscale devices, frames are converted to 4-bit greyscale and packed by a
+    `GreyscaleFramebuffer` rather than by luma, and changes are detected at the panel's 4-bit depth.
+
+    `stats` counts `frames`, `skipped` frames, `sent` bytes, `window` bytes (what sending only the changed
+    windows costs) and `full` bytes (what sending every frame in full costs). Comparing `window` with `full`
+    gives the bytes saved even when running against a dummy device.
+
+    Between `start_capture()` and `end_capture()` frames are kept rather than sent, which is how a stage
+    switch gets the incoming frame for a `Transition` without showing it.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.last_frame = None
+        self.captured = None
+        self.stats = RateCounter('device')
+        self.framebuffer = None
+        if supports_windows(device):
+            self.framebuffer = GreyscaleFramebuffer(
+                device.width, device.height, getattr(device, '_nibble_order', 0))
+
+    def __getattr__(self, name):
+        # Private luma internals are deliberately not exposed so all writes come through here
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.device, name)
+
+    def display(self, image):
+        self.display_window(image, (0, 0, self.device.width, self.device.height))
+
+    def frame(self, image):
+        """
+        The array `image` is kept as: 4-bit greyscale for windowed greyscale devices, otherwise `np.array(image)`.
+        """
+        if self.framebuffer is not None:
+            return self.framebuffer.convert(image)
+        return np.array(image)
+
+    def display_window(self, image, box):
+        """
+        Send `image` to the device, given that nothing outside `box` changed since the last frame.
+        Returns a tuple of (pixels, bytes) sent.
+        """
+        return self._send(self.frame(image), box, image)
+
+    def display_frame(self, frame):
+        """
+        Send a frame that is already an array, as returned by `frame()`.
+        """
+        return self._send(frame, (0, 0, self.device.width, self.device.height))
+
+    def start_capture(self):
+        """
+        Until `end_capture()`, frames are drawn into a copy of the last frame rather than sent.
+        Returns `False` if there is no last frame to start from.
+        """
+        if self.last_frame is None:
+            return False
+        self.captured = self.last_frame.copy()
+        return True
+
+    def end_capture(self):
+        """
+        Stop capturing. Returns a tuple of (last frame sent, frame captured since `start_capture()`).
+        """
+        captured, self.captured = self.captured, None
+        return self.last_frame.copy(), captured
+
+    def _send(self, frame, box, image=None):
+        device = self.device
+        full_box = (0, 0, device.width, device.height)
+
+        if self.captured is not None:
+            left, top, right, bottom = box
+            self.captured[top:bottom, left:right] = frame[top:bottom, left:right]
+            return 0, 0
+
+        full_pixels, full_bytes = window_cost(device, full_box)
+
+        if self.last_frame is None or self.last_frame.shape != frame.shape:
+            changed = full_box
+        else:
+            changed = self._changed_window(frame, box)
+
+        if changed is None:
+            self.stats.add(frames=1, skipped=1, full=full_bytes)
+            return 0, 0
+
+        left, top, right, bottom = changed
+        if self.last_frame is None or changed == full_box:
+            self.last_frame = frame.copy()
+        else:
+            self.last_frame[top:bottom, left:right] = frame[top:bottom, left:right]
+
+        if self.framebuffer is not None:
+            pixels, nbytes = self._write_packed(frame, changed)
+        else:
+            if image is None:
+                image = Image.fromarray(frame)
+            pixels, nbytes = write_window(device, image, changed)
+        self.stats.add(frames=1, sent=nbytes, full=full_bytes,
+                       window=window_cost(device, changed)[1])
+        return pixels, nbytes
+
+    def _write_packed(self, grey, box):
+        left, top, right, bottom = self.device._inflate_bbox(box)
+        packed = self.framebuffer.pack(grey, (left, top, right, bottom))
+        self.device._set_position(top, right, bottom, left)
+        self.device.data(packed.tolist())
+        return (right - left) * (bottom - top), packed.size
+
+    def _changed_window(self, frame, box):
+        left, top, right, bottom = box
+        diff = frame[top:bottom, left:right] != self.last_frame[top:bottom, left:right]
+        if diff.ndim == 3:
+            diff = diff.any(axis=2)
+        rows = np.flatnonzero(diff.any(axis=1))
+        if rows.size == 0:
+            return None
+        cols = np.flatnonzero(diff.any(axis=0))
+        return (left + int(cols[0]), top + int(rows[0]),
+                left + int(cols[-1]) + 1, top + int(rows[-1]) + 1)
+
+    def clear(self):
+        self.display(Image.new(self.device.mode, self.device.size))
@@ -0,0 +1,82 @@
+import itertools
+from collections import OrderedDict
+from threading import Condition
+
+
+def coalesce_key(event):
+    """
+    Events with the same key replace each other while waiting in the queue.
+    Events that ask not to be (`"coalesce": false`), events that ask to be queued behind the current
+    one (`"queue": true`) and patches, which only carry part of the state, are never coalesced.
+    """
+    if event.get('coalesce') is False or event.get('queue') or 'patch' in event:
+        return None
+    return event.get('stage')
+
+
+class EventQueue(object):
+    """
+    Bounded queue of display events in front of the `StageController`.
+
+    `offer()` never blocks: it returns `True` if the event was accepted and `False` if the queue is full.
+    A queued event with the same key as a new one is dropped in favour of the new one (latest wins),
+    which moves to the back of the queue. Events without a key are never coalesced.
+    """
+
+    def __init__(self, maxsize=16, key=coalesce_key):
+        self.maxsize = maxsize
+        self.key = key
+        self.accepted = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self._events = OrderedDict()
+        self._unkeyed = itertools.count()
+        self._cond = Condition()
+
+    def offer(self, event, context=None):
+        key = self.key(event)
+        if key is None:
+            key = ('unkeyed', next(self._unkeyed))
+
+        with self._cond:
+            if key in self._events:
+                del self._events[key]
+                self.coalesced += 1
+            elif len(self._events) >= self.maxsize:
+                self.rejected += 1
+                return False
+            self._events[key] = (event, context)
+            self.accepted += 1
+            self._cond.notify()
+            return True
+
+    def requeue(self, event, context=None):
+        """
+        Put an event that could not be handled back at the front of the queue, unless a newer
+        event with the same key has arrived in the meantime.
+        """
+        key = self.key(event)
+        if key is None:
+            key = ('unkeyed', next(self._unkeyed))
+
+        with self._cond:
+            if key in self._events:
+                return False
+            self._events[key] = (event, context)
+            self._events.move_to_end(key, last=False)
+            self._cond.notify()
+            return True
+
+    def take(self, timeout=None):
+        """
+        Oldest event and its context. Returns `None` if nothing arrived within `timeout` seconds.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._events, timeout):
+                return None
+            _, item = self._events.popitem(last=False)
+            return item
+
+    def __len__(self):
+        with self._cond:
+            return len(self._events)
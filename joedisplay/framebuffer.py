@@ -0,0 +1,116 @@
+import numpy as np
+
+"""
+Vectorized 4-bit greyscale framebuffer for greyscale OLEDs such as the SSD1322.
+
+luma converts each RGB pixel to greyscale and packs it into a nibble in a Python loop. Here the
+conversion and packing are NumPy operations on the whole frame, and the packed buffer is reused
+between frames.
+
+Run `python -m joedisplay.framebuffer` for a micro-benchmark against luma's conversion.
+"""
+
+
+class GreyscaleFramebuffer(object):
+    """
+    Converts frames to 4-bit greyscale arrays and packs windows of them two pixels per byte.
+    With `nibble_order` 0 the left pixel of each pair goes in the high nibble (as on the SSD1322).
+    """
+
+    def __init__(self, width, height, nibble_order=0):
+        self.width = width
+        self.height = height
+        self.nibble_order = nibble_order
+        self._packed = np.zeros(width * height // 2, dtype=np.uint8)
+        self._rgb = np.zeros((height, width), dtype=np.uint32)
+
+    def convert(self, image, out=None):
+        """
+        4-bit greyscale values (0-15) of a PIL `image` in mode "1", "L" or "RGB".
+        Uses the same luma calculation as luma.oled: Y' = 0.299R' + 0.587G' + 0.114B'.
+        """
+        if out is None:
+            out = np.empty((self.height, self.width), dtype=np.uint8)
+        a = np.asarray(image)
+        if image.mode == 'RGB':
+            acc = self._rgb
+            acc[...] = a[:, :, 0]
+            acc *= 306
+            acc += a[:, :, 1].astype(np.uint32) * 601
+            acc += a[:, :, 2].astype(np.uint32) * 117
+            acc >>= 14
+            out[...] = acc
+        elif image.mode == 'L':
+            np.right_shift(a, 4, out=out)
+        elif image.mode == '1':
+            np.multiply(a, 15, out=out, casting='unsafe')
+        else:
+            raise ValueError(f"Unsupported image mode: {image.mode}")
+        return out
+
+    def pack(self, grey, box=None):
+        """
+        Pack the `box` window of `grey` into the reused buffer and return a view of it.
+        The window's left and right edges must be even.
+        """
+        left, top, right, bottom = box or (0, 0, self.width, self.height)
+        window = grey[top:bottom, left:right]
+        packed = self._packed[:window.size // 2].reshape(
+            bottom - top, (right - left) // 2)
+
+        first, second = window[:, 0::2], window[:, 1::2]
+        if self.nibble_order != 0:
+            first, second = second, first
+        np.left_shift(first, 4, out=packed)
+        packed |= second
+        return packed.reshape(-1)
+
+    def unpack(self, packed, out=None):
+        """
+        The reverse of `pack` for a whole frame: 4-bit greyscale values from two pixels per byte.
+        """
+        if out is None:
+            out = np.empty((self.height, self.width), dtype=np.uint8)
+        packed = packed.reshape(self.height, self.width // 2)
+        first, second = out[:, 0::2], out[:, 1::2]
+        if self.nibble_order != 0:
+            first, second = second, first
+        np.right_shift(packed, 4, out=first)
+        np.bitwise_and(packed, 15, out=second)
+        return out
+
+
+if __name__ == "__main__":
+    """
+    Compare luma's per-pixel conversion with the vectorized path on a hardware-free SSD1322.
+    """
+    import timeit
+    from PIL import Image, ImageDraw
+    from luma.core.interface.serial import noop
+    from luma.oled.device import ssd1322
+
+    device = ssd1322(noop(), width=256, height=64)
+    image = Image.new('RGB', device.size)
+    draw = ImageDraw.Draw(image)
+    for i in range(0, 256, 16):
+        draw.rectangle((i, 0, i + 15, 63), fill=(i, i, i))
+    draw.text((10, 10), "14:25 Edinburgh Waverley", fill="white")
+
+    def luma_path():
+        buf = bytearray(device.width * device.height >> 1)
+        device._populate(buf, image.getdata())
+        return buf
+
+    fb = GreyscaleFramebuffer(device.width, device.height)
+    grey = np.empty((device.height, device.width), dtype=np.uint8)
+
+    def numpy_path():
+        return fb.pack(fb.convert(image, out=grey))
+
+    assert bytes(luma_path()) == numpy_path().tobytes()
+
+    n = 50
+    luma_time = timeit.timeit(luma_path, number=n) / n
+    numpy_time = timeit.timeit(numpy_path, number=n) / n
+    print(f"luma:  {luma_time * 1000:.2f}ms per frame")
+    print(f"numpy: {numpy_time * 1000:.2f}ms per frame ({luma_time / numpy_time:.0f}x)")
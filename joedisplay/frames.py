@@ -0,0 +1,184 @@
+import base64
+
+import numpy as np
+
+from .framebuffer import GreyscaleFramebuffer
+
+"""
+Compressed frames for displays that show what a producer rendered rather than render it themselves.
+
+A frame is the panel's own format: 4-bit greyscale packed two pixels per byte (8192 bytes at 256x64).
+It is sent as a `frame` display event:
+
+    {"stage": "frame", "seq": 12, "encoding": "rle", "width": 256, "height": 64, "data": "<base64>"}
+
+`rle` is the packed frame run-length encoded as (count, byte) pairs. `delta` is the XOR of the packed
+frame with frame `base`, run-length encoded the same way, so unchanged areas cost two bytes per 255
+bytes of frame. A key frame that doesn't compress is sent `raw` instead of `rle`. A display that does
+not have frame `base` ignores a delta and waits for the next key frame. Deltas carry `"coalesce": false`
+so the event queue never drops one in favour of a later one.
+
+Run `python -m joedisplay.frames` for a micro-benchmark.
+"""
+
+
+def encode_rle(data):
+    """
+    Run-length encode a 1D uint8 array as (count, byte) pairs, with runs of at most 255.
+    """
+    if data.size == 0:
+        return b''
+    starts = np.concatenate(([0], np.flatnonzero(data[1:] != data[:-1]) + 1))
+    lengths = np.diff(np.append(starts, data.size))
+    values = data[starts]
+
+    # Split runs longer than 255 into chunks of 255 and a remainder
+    chunks = (lengths + 254) // 255
+    pairs = np.empty((int(chunks.sum()), 2), dtype=np.uint8)
+    pairs[:, 0] = 255
+    pairs[np.cumsum(chunks) - 1, 0] = lengths - (chunks - 1) * 255
+    pairs[:, 1] = np.repeat(values, chunks)
+    return pairs.tobytes()
+
+
+def decode_rle(encoded, size):
+    """
+    Decode (count, byte) pairs back into a uint8 array of `size` bytes.
+    """
+    pairs = np.frombuffer(encoded, dtype=np.uint8).reshape(-1, 2)
+    data = np.repeat(pairs[:, 1], pairs[:, 0])
+    if data.size != size:
+        raise ValueError(f"Decoded {data.size} bytes, expected {size}")
+    return data
+
+
+class FrameEncoder(object):
+    """
+    Encodes a stream of 4-bit greyscale frames as `frame` events.
+    A key frame is sent first, every `keyframe_interval` frames, and whenever a delta would not be smaller.
+    """
+
+    def __init__(self, width=256, height=64, keyframe_interval=30):
+        self.width = width
+        self.height = height
+        self.keyframe_interval = keyframe_interval
+        self.framebuffer = GreyscaleFramebuffer(width, height)
+        self.seq = 0
+        self.previous = None
+        self.since_keyframe = 0
+
+    def encode(self, grey, keyframe=False):
+        """
+        The event for the 4-bit greyscale array `grey`, or `None` if it is the same as the last frame.
+        """
+        packed = self.framebuffer.pack(grey).copy()
+        if not keyframe and self.previous is not None and np.array_equal(packed, self.previous):
+            return None
+
+        event = {'stage': 'frame', 'width': self.width, 'height': self.height}
+        data = encode_rle(packed)
+        keyframe = keyframe or self.previous is None or self.since_keyframe >= self.keyframe_interval
+        if not keyframe:
+            delta = encode_rle(packed ^ self.previous)
+            if len(delta) < len(data):
+                event.update({'encoding': 'delta', 'base': self.seq, 'coalesce': False})
+                data = delta
+                self.since_keyframe += 1
+            else:
+                keyframe = True
+        if keyframe:
+            event['encoding'], data = self._key(packed, data)
+            self.since_keyframe = 0
+
+        self.seq += 1
+        self.previous = packed
+        event['seq'] = self.seq
+        event['data'] = base64.b64encode(data).decode('ascii')
+        return event
+
+    def keyframe(self):
+        """
+        A key frame of the last frame encoded, with the same `seq`, for displays that don't have the
+        frame a delta is based on. `None` before the first frame.
+        """
+        if self.previous is None:
+            return None
+        encoding, data = self._key(self.previous)
+        return {'stage': 'frame', 'width': self.width, 'height': self.height, 'encoding': encoding,
+                'seq': self.seq, 'data': base64.b64encode(data).decode('ascii')}
+
+    @staticmethod
+    def _key(packed, data=None):
+        """
+        The encoding and data of a key frame: `rle`, or `raw` if that doesn't compress.
+        """
+        if data is None:
+            data = encode_rle(packed)
+        if len(data) >= packed.size:
+            return 'raw', packed.tobytes()
+        return 'rle', data
+
+
+class FrameDecoder(object):
+    """
+    Decodes `frame` events back to 4-bit greyscale arrays, keeping the last frame to apply deltas to.
+    """
+
+    def __init__(self, width=256, height=64):
+        self.framebuffer = GreyscaleFramebuffer(width, height)
+        self.size = width * height // 2
+        self.seq = None
+        self.packed = None
+
+    def decode(self, event):
+        """
+        The 4-bit greyscale array for `event`, or `None` for a delta against a frame this decoder doesn't have.
+        """
+        encoded = base64.b64decode(event['data'])
+        if event['encoding'] == 'raw':
+            data = np.frombuffer(encoded, dtype=np.uint8)
+        elif event['encoding'] == 'rle':
+            data = decode_rle(encoded, self.size)
+        elif event['encoding'] == 'delta':
+            if self.packed is None or event.get('base') != self.seq:
+                return None
+            data = decode_rle(encoded, self.size) ^ self.packed
+        else:
+            raise ValueError(f"Unknown frame encoding: {event['encoding']}")
+        self.packed = data
+        self.seq = event.get('seq')
+        return self.framebuffer.unpack(data)
+
+
+if __name__ == "__main__":
+    import time
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (256, 64))
+    draw = ImageDraw.Draw(image)
+    for row in range(4):
+        draw.text((0, row * 12), f"14:2{row}  Edinburgh Waverley   Plat {row + 1}   On time", fill="white")
+
+    encoder = FrameEncoder()
+    grey = encoder.framebuffer.convert(image)
+    runs = 200
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        key = encoder.encode(grey, keyframe=True)
+    key_time = (time.perf_counter() - start) / runs
+
+    draw.rectangle((100, 52, 160, 63), fill="black")
+    draw.text((100, 52), "20:00:01", fill="white")
+    delta = encoder.encode(encoder.framebuffer.convert(image))
+
+    decoder = FrameDecoder()
+    decoder.decode(key)
+    start = time.perf_counter()
+    for _ in range(runs):
+        decoder.decode(key)
+    decode_time = (time.perf_counter() - start) / runs
+
+    print(f"key frame: {len(key['data'])} bytes of base64 in {key_time * 1000:.2f}ms")
+    print(f"delta:     {len(delta['data'])} bytes of base64 ({delta['encoding']})")
+    print(f"decode:    {decode_time * 1000:.2f}ms (8192 bytes raw)")
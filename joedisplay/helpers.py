@@ -1,8 +1,64 @@
+import logging
 import os
+import time
+from threading import Lock, Thread
 from PIL import ImageFont
 
+logger = logging.getLogger(__name__)
+
+
+class FontRegistry(object):
+    """
+    Process-wide cache of TrueType faces keyed by (name, size). Faces are loaded from the bundled
+    `fonts` directory the first time they are asked for, or ahead of time with `preload`.
+    """
+
+    def __init__(self):
+        self._fonts = {}
+        self._lock = Lock()
+        self.loads = 0
+        self.hits = 0
+        self.load_time = 0.0
+
+    def get(self, name, size):
+        key = (name, size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self.hits += 1
+                return font
+
+            start = time.monotonic()
+            font_path = os.path.abspath(os.path.join(
+                os.path.dirname(__file__), 'fonts', name))
+            font = ImageFont.truetype(font_path, size)
+            self.load_time += time.monotonic() - start
+            self.loads += 1
+            self._fonts[key] = font
+            return font
+
+    def preload(self, fonts, background=True):
+        """
+        Load each (name, size) in `fonts`. Runs in a daemon thread unless `background` is `False`.
+        """
+        def load():
+            for name, size in fonts:
+                self.get(name, size)
+            logger.info("Preloaded fonts: %s", self.stats())
+
+        if not background:
+            load()
+            return None
+        t = Thread(target=load, name='font-preload', daemon=True)
+        t.start()
+        return t
+
+    def stats(self):
+        return {'loads': self.loads, 'hits': self.hits, 'load_time': self.load_time}
+
+
+fonts = FontRegistry()
+
 
 def make_font(name, size):
-    font_path = os.path.abspath(os.path.join(
-        os.path.dirname(__file__), 'fonts', name))
-    return ImageFont.truetype(font_path, size)
+    return fonts.get(name, size)
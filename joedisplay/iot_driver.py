@@ -1,8 +1,10 @@
 import logging
 import os
 import json
+import random
 import time
-from threading import Timer
+from datetime import datetime, timedelta
+from threading import Event, Thread
 from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTClient, AWSIoTMQTTShadowClient
 
 logger = logging.getLogger(__name__)
@@ -13,24 +15,93 @@ Handles display bootstrap and on-going requests for data. See awsiot_display.py
 Discussed more in `AWSIOT.md`
 
 - Request shadow to establish state
-- Send a data request to `display/producers/<stage name>` containing context from shadow at a timed interval
+- Send a data request to `display/producers/<stage name>` containing context from shadow, at intervals
+  picked by a `RefreshPolicy` from what is on display
 - Listen for
     - Display events (and send them to provided `StageController`)
     - Deltas to shadow and apply them to current state
 """
 
 
-class IoTDisplayDriver(object):
-    REFRESH_INTERVAL = 60
+class RefreshPolicy(object):
+    """
+    Picks how long to wait before the next data request.
+
+    The wait is the shortest of `default` (or the `refresh_rate` in the data), the `valid_for` of the
+    last display event and the stage's own `next_refresh` hint (e.g. when the board runs out of trains),
+    kept between `minimum` and `maximum` seconds. During `quiet_hours`, a (start, end) pair of local hours,
+    requests wait until the end of them, at most `quiet_interval` seconds at a time.
+    Every wait is spread by +/- `jitter` (a fraction) so that displays started together don't request together.
+    """
+
+    def __init__(self, default=120, minimum=15, maximum=900, quiet_hours=None, quiet_interval=1800,
+                 jitter=0.1, random=random.random):
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.quiet_hours = quiet_hours
+        self.quiet_interval = quiet_interval
+        self.jitter = jitter
+        self.random = random
+
+    def quiet_for(self, now):
+        """
+        Seconds until the end of the quiet hours, or 0 if `now` is not in them.
+        """
+        if not self.quiet_hours:
+            return 0
+        start, end = self.quiet_hours
+        hour = now.hour
+        quiet = start <= hour < end if start <= end else hour >= start or hour < end
+        if not quiet:
+            return 0
+        until = now.replace(hour=end, minute=0, second=0, microsecond=0)
+        if until <= now:
+            until += timedelta(days=1)
+        return (until - now).total_seconds()
+
+    def interval(self, data, event=None, hint=None, now=None):
+        now = now or datetime.now()
+        quiet = self.quiet_for(now)
+        if quiet:
+            interval = min(quiet, self.quiet_interval)
+        else:
+            event_data = (event or {}).get('data')
+            if not isinstance(event_data, dict):
+                # e.g. a frame event, whose data is the frame
+                event_data = {}
+            candidates = [data.get('refresh_rate') or event_data.get('refresh_rate') or self.default,
+                          event_data.get('valid_for'), hint]
+            interval = min(c for c in candidates if c is not None)
+            interval = max(self.minimum, min(interval, self.maximum))
+        return interval * (1 + self.jitter * (2 * self.random() - 1))
+
 
-    def __init__(self, client_id, display_topic, endpoint, ca, key, cert, stage_controller):
+class IoTDisplayDriver(object):
+    """
+    Data requests are sent from one thread, at the time picked by `refresh_policy` (a `RefreshPolicy`).
+    `requests_sent` counts data requests and `display_changes` the display events whose content (see
+    `Stage.content`) differed from the one before, i.e. the requests that were worth sending.
+    """
+    REFRESH_INTERVAL = 120
+
+    def __init__(self, client_id, display_topic, endpoint, ca, key, cert, stage_controller, refresh_policy=None):
         self.client_id = client_id
         self.display_topic = display_topic
         self.stage_controller = stage_controller
+        self.refresh_policy = refresh_policy or RefreshPolicy(default=self.REFRESH_INTERVAL)
 
-        self.refresh_timer = None
         self.show_text_cb = None
         self.state = {}
+        self.last_event = None
+        self.last_content = None
+        self.requests_sent = 0
+        self.display_changes = 0
+
+        self.next_request_at = None
+        self._refresh_wake = Event()
+        self._stopped = False
+        self.refresher = Thread(target=self._refresh_loop, name='data-requests', daemon=True)
 
         client = AWSIoTMQTTClient(client_id)
         client.configureEndpoint(endpoint, 8883)
@@ -58,12 +129,56 @@ class IoTDisplayDriver(object):
             'client_id': self.client_id,
             'data': self.state.get('data', {})
         }
+        stage = self.stage_controller.active_stage
+        if stage is not None:
+            command.update(stage.request_context())
         self.client.publishAsync(
             f"display/producers/{self.state['stage']}", json.dumps(command), QoS=1, ackCallback=None)
-
-        self.refresh_timer = Timer(
-            self.REFRESH_INTERVAL, self.send_data_request)
-        self.refresh_timer.start()
+        self.requests_sent += 1
+
+        # In case there's no response. A display event reschedules from what it shows.
+        self.schedule_refresh(self.refresh_interval())
+
+    def content(self, event):
+        stage = self.stage_controller.stages.get(event.get('stage'))
+        return event if stage is None else stage.content(event)
+
+    def refresh_interval(self):
+        event = self.last_event
+        hint = None
+        if event is not None:
+            stage = self.stage_controller.stages.get(event.get('stage'))
+            if stage is not None:
+                hint = stage.next_refresh(event, datetime.now())
+        return self.refresh_policy.interval(self.state.get('data') or {}, event, hint)
+
+    def schedule_refresh(self, delay):
+        """
+        Send the next data request in `delay` seconds, or never if `delay` is `None`.
+        """
+        self.next_request_at = None if delay is None else time.monotonic() + delay
+        if delay is not None:
+            logger.info("Next data request in %.0fs", delay)
+        self._refresh_wake.set()
+
+    def _refresh_loop(self):
+        while not self._stopped:
+            due = self.next_request_at
+            timeout = None if due is None else max(0, due - time.monotonic())
+            if self._refresh_wake.wait(timeout):
+                # Rescheduled, or stopping
+                self._refresh_wake.clear()
+                continue
+            if self.next_request_at != due:
+                continue
+            self.next_request_at = None
+            if 'stage' not in self.state:
+                continue
+            try:
+                self.send_data_request()
+            except Exception:
+                logger.exception("Could not send data request")
+                self.schedule_refresh(self.refresh_policy.minimum)
 
     def on_shadow_response(self, payload_s, status, token):
         logger.info('Got shadow response')
@@ -75,18 +190,19 @@ class IoTDisplayDriver(object):
         elif status == 'accepted':
             self.show_text('Got device shadow.')
             self.state = payload['state']['reported']
-            self.refresh_timer = Timer(1, self.send_data_request)
-            self.refresh_timer.start()
+            self.schedule_refresh(1)
 
     def on_shadow_delta(self, payload_s, status, token):
         logger.info('Got shadow update')
-        self.cancel_refresh_timer()
+        self.schedule_refresh(None)
         payload = json.loads(payload_s)
         delta = payload['state']
         if delta.get('stage'):
             self.state['data'] = {}
 
         self.state.update(delta)
+        # What's on display no longer says anything about when to refresh
+        self.last_event = None
 
         def _update_shadow_callback(payload, status, token):
             logger.info("Updated shadow: %s", status)
@@ -98,15 +214,24 @@ class IoTDisplayDriver(object):
             }
         }), _update_shadow_callback, 10)
 
-        self.refresh_timer = Timer(1, self.send_data_request)
-        self.refresh_timer.start()
+        self.schedule_refresh(1)
 
     def on_display_event(self, client, userdata, message):
         logger.info('Got display event')
         event = json.loads(message.payload)
-        self.stage_controller.event_handler(event, {})
+        self.stage_controller.submit(event, {})
+
+        content = (event.get('stage'), self.content(event))
+        if content != self.last_content:
+            self.display_changes += 1
+        self.last_content = content
+        logger.info("%d of %d data requests changed the display", self.display_changes, self.requests_sent)
+        if event.get('stage') == self.state.get('stage'):
+            self.last_event = event
+            self.schedule_refresh(self.refresh_interval())
 
     def start(self):
+        self.refresher.start()
         self.show_text('Starting...')
         self.client.connect()
 
@@ -119,11 +244,7 @@ class IoTDisplayDriver(object):
 
         self.client.subscribe(self.display_topic, 1, self.on_display_event)
 
-    def cancel_refresh_timer(self):
-        if self.refresh_timer:
-            self.refresh_timer.cancel()
-            self.refresh_timer = None
-
     def stop(self):
-        self.cancel_refresh_timer()
+        self._stopped = True
+        self.schedule_refresh(None)
         self.client.disconnect()
@@ -0,0 +1,70 @@
+from functools import lru_cache
+
+"""
+Text measurement from per-font glyph advance tables, so layout code doesn't need to rasterize
+text to find out how big it is. Widths are the sum of glyph advances (no kerning), which is exact
+for the bitmap-style fonts used on the display.
+"""
+
+
+class GlyphAdvances(object):
+    """
+    Advance widths of the glyphs of one font, filled in as characters are first seen.
+    """
+
+    def __init__(self, font):
+        self.font = font
+        ascent, descent = font.getmetrics()
+        self.height = ascent + descent
+        self._advances = {}
+
+    def advance(self, ch):
+        a = self._advances.get(ch)
+        if a is None:
+            if hasattr(self.font, 'getlength'):
+                a = int(round(self.font.getlength(ch)))
+            else:
+                a = self.font.getsize(ch)[0]
+            self._advances[ch] = a
+        return a
+
+    def width(self, text):
+        return sum(self.advance(ch) for ch in text)
+
+
+_tables = {}
+
+
+def advances(font):
+    table = _tables.get(font)
+    if table is None:
+        table = _tables[font] = GlyphAdvances(font)
+    return table
+
+
+@lru_cache(maxsize=1024)
+def measure(text, font):
+    """
+    (width, height) of `text` in `font`. Height is the font's line height.
+    """
+    table = advances(font)
+    return table.width(text), table.height
+
+
+@lru_cache(maxsize=256)
+def fit_text(text, font, width, ellipsis='...'):
+    """
+    `text` unchanged if it fits in `width` pixels, otherwise the longest prefix that fits
+    with `ellipsis` appended.
+    """
+    table = advances(font)
+    if table.width(text) <= width:
+        return text
+
+    available = width - table.width(ellipsis)
+    used = 0
+    for i, ch in enumerate(text):
+        used += table.advance(ch)
+        if used > available:
+            return text[:i].rstrip() + ellipsis
+    return text
@@ -0,0 +1,64 @@
+from luma.core.device import dummy
+
+from .framebuffer import GreyscaleFramebuffer
+from .frames import FrameEncoder
+
+"""
+Server-side rendering: run a stage where the data is produced and send displays the result.
+"""
+
+
+class FrameRenderer(object):
+    """
+    Runs `stage_class` against an in-memory luma device and returns what it draws as `frame` events,
+    for a display's `FrameStage` to show.
+
+    A frame is a snapshot. A stage with a clock (see `Stage.CLOCK`) is drawn without it and its frames
+    carry `"clock": [top, height]`, so the display draws a clock that keeps ticking. Other stages that
+    animate between events are refused: `render` raises `ValueError` if the stage asks for frames after
+    handling the event. Send those displays the data instead.
+
+    `render` returns a delta against the previous frame where that is smaller, and `keyframe()` the
+    same frame whole, for displays that don't have the previous one.
+    """
+
+    def __init__(self, stage_class, width=256, height=64, keyframe_interval=30):
+        self.device = dummy(width=width, height=height)
+        self.clock = stage_class.CLOCK
+        if self.clock is not None:
+            self.stage = stage_class(self.device, clock=False)
+        else:
+            self.stage = stage_class(self.device)
+        self.stage.start()
+        self.framebuffer = GreyscaleFramebuffer(width, height)
+        self.encoder = FrameEncoder(width, height, keyframe_interval)
+
+    def render(self, event, context=None, keyframe=False):
+        """
+        Hand `event` to the stage and return the frame event for what it drew, or `None` if nothing changed.
+        """
+        if 'patch' in event:
+            self.stage.patch(event['patch'], context)
+        else:
+            self.stage.handle(event, context)
+        if self.stage.frame_interval() is not None:
+            raise ValueError(f"{self.stage.NAME} animates, so it can't be sent as frames")
+        return self.refresh(keyframe)
+
+    def refresh(self, keyframe=False):
+        self.stage.refresh()
+        if self.device.image is None:
+            return None
+        grey = self.framebuffer.convert(self.device.image)
+        return self._with_clock(self.encoder.encode(grey, keyframe))
+
+    def keyframe(self):
+        """
+        The last frame rendered as a key frame, or `None` if nothing has been rendered.
+        """
+        return self._with_clock(self.encoder.keyframe())
+
+    def _with_clock(self, event):
+        if event is not None and self.clock is not None:
+            event['clock'] = list(self.clock)
+        return event
@@ -0,0 +1,112 @@
+import logging
+import time
+from threading import Thread, Event, RLock
+
+logger = logging.getLogger(__name__)
+
+
+class FrameScheduler(Thread):
+    """
+    Single render loop that calls `refresh()` on the active stage.
+
+    The stage says how often it needs a frame through `frame_interval()` (seconds, or `None` if it only
+    changes when it handles an event). The rate is capped at `fps`. Frames are scheduled on a fixed grid of
+    multiples of the interval, so pacing does not drift and a frame that overruns skips to the next slot
+    rather than bursting to catch up.
+
+    `wake()` forces an immediate frame, e.g. after an event has been handled.
+    `play()` shows a `Transition` in place of the stage until it is done.
+    All stage calls are made holding `lock`, which is shared with the `StageController`. Holding it
+    guarantees no frame is being drawn.
+    """
+
+    def __init__(self, fps=40, lock=None, clock=time.time):
+        super(FrameScheduler, self).__init__(name='frame-scheduler', daemon=True)
+        self.min_interval = 1.0 / fps
+        self.lock = lock or RLock()
+        self.clock = clock
+        self.stage = None
+        self.transition = None
+        self.on_transition_done = None
+        self.on_first_frame = None
+        self.frames = 0
+        self.overruns = 0
+        self._wake = Event()
+        self._stopped = False
+
+    def set_stage(self, stage, on_first_frame=None):
+        """
+        Draw `stage` from the next frame. `on_first_frame` is called once the first frame since has been
+        written to the device, which is the first frame of the transition if one is played in between.
+        """
+        with self.lock:
+            self.stage = stage
+            self.transition = None
+            self.on_transition_done = None
+            self.on_first_frame = on_first_frame
+        self.wake()
+
+    def play(self, transition, on_done=None):
+        """
+        Play `transition` before drawing the stage again. `on_done` is called once it has finished.
+        """
+        with self.lock:
+            self.transition = transition
+            self.on_transition_done = on_done
+        self.wake()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopped = True
+        self.wake()
+
+    def next_interval(self):
+        with self.lock:
+            stage = self.transition or self.stage
+            interval = stage.frame_interval() if stage is not None else None
+        if interval is None:
+            return None
+        return max(interval, self.min_interval)
+
+    def run(self):
+        while not self._stopped:
+            interval = self.next_interval()
+            if interval is None:
+                self._wake.wait()
+            else:
+                now = self.clock()
+                deadline = (now // interval + 1) * interval
+                self._wake.wait(deadline - now)
+            self._wake.clear()
+            if self._stopped:
+                break
+            self.render(interval)
+
+    def render(self, interval):
+        start = time.monotonic()
+        with self.lock:
+            if self.stage is None:
+                return
+            try:
+                if self.transition is not None:
+                    self.transition.refresh()
+                    if self.transition.done:
+                        self.transition = None
+                        if self.on_transition_done is not None:
+                            self.on_transition_done()
+                            self.on_transition_done = None
+                if self.transition is None:
+                    self.stage.refresh()
+            except Exception:
+                self.transition = None
+                self.on_transition_done = None
+                logger.exception("Error refreshing stage")
+            if self.on_first_frame is not None:
+                self.on_first_frame()
+                self.on_first_frame = None
+        self.frames += 1
+        if interval is not None and time.monotonic() - start > interval:
+            self.overruns += 1
+            logger.debug("Frame overran %.3fs interval", interval)
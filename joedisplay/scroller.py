@@ -0,0 +1,75 @@
+import time
+from PIL import Image, ImageDraw
+
+from .sprites import text_size
+
+"""
+Scrolling built on a pre-rasterized strip. The content is drawn once and each frame is a crop
+of the strip, so a frame costs the same however complex the content is.
+"""
+
+
+class StripScroller(object):
+    """
+    Scrolls `strip` (a PIL image) right-to-left through a window of `width` x strip height at `speed`
+    pixels per second. The offset is taken from a monotonic clock, so the speed doesn't depend on
+    how often or how quickly frames are rendered.
+
+    If `loop` is set the strip wraps around forever, otherwise `done` becomes true once the end of the
+    strip has reached the left edge of the window.
+    """
+
+    def __init__(self, strip, width, speed=40, loop=False, clock=time.monotonic):
+        self.strip = strip
+        self.width = width
+        self.height = strip.height
+        self.speed = speed
+        self.loop = loop
+        self.clock = clock
+        self.started = clock()
+
+    @classmethod
+    def for_text(cls, text, font, width, height, mode='RGB', fill="white", lead_in=True, gap=None, **kwargs):
+        """
+        Strip containing `text`. With `lead_in` the text starts just off the right of the window.
+        `gap` pixels of blank space follow the text; by default a window's width, so the text
+        scrolls all the way off before the scroller is done.
+        """
+        w, h = text_size(text, font)
+        x = width if lead_in else 0
+        if gap is None:
+            gap = width
+        strip = Image.new(mode, (max(x + w + gap, width), height))
+        ImageDraw.Draw(strip).text((x, 0), text, font=font, fill=fill)
+        return cls(strip, width, **kwargs)
+
+    def restart(self):
+        self.started = self.clock()
+
+    def offset(self, now=None):
+        if now is None:
+            now = self.clock()
+        x = int((now - self.started) * self.speed)
+        if self.loop:
+            return x % self.strip.width
+        return min(x, self.strip.width - self.width)
+
+    @property
+    def done(self):
+        return not self.loop and self.offset() >= self.strip.width - self.width
+
+    def frame(self, now=None):
+        """
+        The window at the current offset, as a new image of `width` x `height`.
+        """
+        x = self.offset(now)
+        end = x + self.width
+        if end <= self.strip.width:
+            return self.strip.crop((x, 0, end, self.height))
+
+        # Wrapped around: join the end of the strip to its start
+        im = Image.new(self.strip.mode, (self.width, self.height))
+        im.paste(self.strip.crop((x, 0, self.strip.width, self.height)), (0, 0))
+        im.paste(self.strip.crop((0, 0, end - self.strip.width, self.height)),
+                 (self.strip.width - x, 0))
+        return im
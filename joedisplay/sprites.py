@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from threading import Lock
+from PIL import Image, ImageColor, ImageDraw
+
+"""
+Cache of rasterized text so strings that don't change between redraws are pasted rather than re-drawn.
+"""
+
+
+def text_size(text, font):
+    """
+    Size of the rasterized `text`, including any glyph overhang past the advance width.
+    """
+    if hasattr(font, 'getbbox'):
+        left, top, right, bottom = font.getbbox(text)
+        return right, bottom
+    return font.getsize(text)
+
+
+class SpriteCache(object):
+    """
+    LRU of greyscale ('L' mode) text sprites keyed by (text, font, fill), capped at `max_bytes`.
+    Sprites are drawn through `draw`, which uses them as a mask so only the text pixels are touched.
+    """
+
+    def __init__(self, max_bytes=256 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sprites = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, text, font, fill="white"):
+        key = (text, font, fill)
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is not None:
+                self._sprites.move_to_end(key)
+                self.hits += 1
+                return sprite
+            self.misses += 1
+
+        sprite = self.rasterize(text, font, fill)
+
+        with self._lock:
+            if key not in self._sprites:
+                self._sprites[key] = sprite
+                self.bytes += sprite.width * sprite.height
+                self._evict()
+        return sprite
+
+    def draw(self, draw, xy, text, font, fill="white"):
+        """
+        Equivalent of `draw.text(xy, text, font=font, fill=fill)` on a black background.
+        """
+        if text:
+            draw.bitmap(xy, self.get(text, font, fill), fill="white")
+
+    def rasterize(self, text, font, fill):
+        w, h = text_size(text, font)
+        sprite = Image.new('L', (max(w, 1), max(h, 1)))
+        ImageDraw.Draw(sprite).text((0, 0), text, font=font,
+                                    fill=ImageColor.getcolor(fill, 'L'))
+        return sprite
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and len(self._sprites) > 1:
+            _, sprite = self._sprites.popitem(last=False)
+            self.bytes -= sprite.width * sprite.height
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._sprites.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'sprites': len(self._sprites), 'bytes': self.bytes}
+
+
+sprites = SpriteCache()
@@ -1,3 +1,8 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
 class Stage(object):
     """
     A stage is a screen configuration such as a train times display board or text terminal.
@@ -5,7 +10,32 @@ class Stage(object):
     messages from subscribed topics. The `stage` property in the event payload determines the stage to use.
     If this differs from the active stage, the active stage is stopped and the new stage is created and started.
     Stages follow a loose interface: they must implement `start(), stop() and handle(event, context)`.
+
+    Stages do not run their own threads. The controller's frame scheduler calls `refresh()` on the active
+    stage after each event and then every `frame_interval()` seconds. Return `None` from `frame_interval()`
+    when nothing changes until the next event.
+
+    Stopped stages may be cached by the controller and started again later, so `start()` must leave the
+    stage ready to repaint the whole frame on the next refresh. `stop()` must not return until the stage
+    will no longer touch the device; a stage that does use its own thread should join it (with a timeout).
+
+    Stages that support partial updates implement `patch(patch, context)`. It is called with the `patch`
+    property of events such as `{"stage": "...", "patch": {...}}` while the stage is active.
+
+    `FONTS` lists the (name, size) fonts a stage uses, so they can be preloaded at startup.
+
+    Stages whose data comes from a producer can implement the static `next_refresh(event, now)` to say how
+    many seconds the data in `event` is good for, judging by its content (e.g. when the board runs out of
+    trains). Drivers use it to decide when to ask for more. The static `content(event)` is the part of `event` that
+    is displayed, so drivers can tell whether an event changed the display; by default the whole event.
+    `request_context()` returns fields for drivers to add to their data requests while the stage is active.
+
+    Stages that show a clock can still be rendered elsewhere as frames (see `joedisplay.render`): they set
+    `CLOCK` to the (top, height) of the full-width row the clock takes and accept `clock=False` to leave
+    it empty. The display's `FrameStage` then draws the clock in that row itself.
     """
+    FONTS = []
+    CLOCK = None
 
     def start(self):
         pass
@@ -15,3 +45,23 @@ class Stage(object):
 
     def handle(self, event, context):
         pass
+
+    def patch(self, patch, context):
+        logger.warning("%s does not support patch events", self.NAME)
+
+    def refresh(self):
+        pass
+
+    def frame_interval(self):
+        return None
+
+    @staticmethod
+    def next_refresh(event, now):
+        return None
+
+    @staticmethod
+    def content(event):
+        return event
+
+    def request_context(self):
+        return {}
@@ -1,2 +1,4 @@
 from .text import TerminalStage, ScrollStage
 from .metrics import MetricsStage
+from .animation import AnimationStage
+from .frame import FrameStage
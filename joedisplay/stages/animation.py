@@ -0,0 +1,126 @@
+import logging
+import os
+import time
+
+import numpy as np
+
+from joedisplay.animation import AnimationFile
+from joedisplay.device import display_greyscale
+from joedisplay.framebuffer import GreyscaleFramebuffer
+from joedisplay import Stage
+
+logger = logging.getLogger(__name__)
+
+
+class AnimationStage(Stage):
+    """
+    Plays a pre-rendered animation file (see `joedisplay.animation`) from a memory mapping.
+    File names are looked up in `DIRECTORY`, which defaults to `animations` or `ANIMATION_DIR`. Names that
+    are absolute or lead out of it are refused, as they arrive over the network.
+
+    `fps` defaults to the file's own rate. `loop` defaults to true; otherwise the last frame stays up.
+    `seek` starts from that frame. Sending the same file again changes these without reopening it,
+    as does a patch event carrying any of them.
+    Example payload in example-display-events/animation.json
+    """
+    NAME = 'animation'
+    DIRECTORY = os.getenv('ANIMATION_DIR', 'animations')
+
+    def __init__(self, device, clock=time.monotonic):
+        self.device = device
+        self.clock = clock
+        self.animation = None
+        self.framebuffer = None
+        self.grey = None
+        self.fps = None
+        self.loop = True
+        self.first = 0
+        self.started = None
+        self.shown = None
+
+    def open(self, name):
+        """
+        Map the animation file `name`, unless it is already open. Returns `True` if it was opened.
+        Raises `ValueError` if `name` is not a file in `DIRECTORY`.
+        """
+        if os.path.isabs(name):
+            raise ValueError(f"{name} is not a relative path")
+        directory = os.path.realpath(self.DIRECTORY)
+        path = os.path.realpath(os.path.join(directory, name))
+        if os.path.commonpath([directory, path]) != directory:
+            raise ValueError(f"{name} is outside {self.DIRECTORY}")
+        if self.animation is not None and self.animation.path == path:
+            return False
+        animation = AnimationFile(path)
+        if (animation.width, animation.height) != self.device.size:
+            animation.close()
+            raise ValueError(f"{name} is {animation.width}x{animation.height}, "
+                             f"the display is {self.device.width}x{self.device.height}")
+        if self.animation is not None:
+            self.animation.close()
+        self.animation = animation
+        self.framebuffer = GreyscaleFramebuffer(animation.width, animation.height)
+        self.grey = np.empty((animation.height, animation.width), dtype=np.uint8)
+        self.fps = None
+        self.loop = True
+        self.first = 0
+        self.started = None
+        return True
+
+    def play(self, options):
+        if self.animation is None or not len(self.animation):
+            return
+        self.fps = options.get('fps', self.fps) or self.animation.fps
+        self.loop = options.get('loop', self.loop)
+        self.first = options.get('seek', self.current()) % len(self.animation)
+        self.started = self.clock()
+
+    def current(self):
+        if self.started is None:
+            return self.first
+        i = self.first + int((self.clock() - self.started) * self.fps)
+        if self.loop:
+            return i % len(self.animation)
+        return min(i, len(self.animation) - 1)
+
+    @property
+    def done(self):
+        return not self.loop and self.shown == len(self.animation) - 1
+
+    def start(self):
+        self.shown = None
+
+    def stop(self):
+        # Carry on from the same frame if started again
+        if self.animation is not None:
+            self.first = self.current()
+            self.started = None
+
+    def refresh(self):
+        if self.animation is None or not len(self.animation):
+            return
+        if self.started is None:
+            self.started = self.clock()
+        i = self.current()
+        if i == self.shown:
+            return
+        grey = self.framebuffer.unpack(self.animation.frame(i), out=self.grey)
+        display_greyscale(self.device, grey)
+        self.shown = i
+
+    def frame_interval(self):
+        if not self.fps or self.done:
+            return None
+        return 1.0 / self.fps
+
+    def handle(self, event, context):
+        try:
+            self.open(event['file'])
+        except (OSError, ValueError) as e:
+            logger.error("Could not open animation %s: %s", event['file'], e)
+            return
+        self.play(event)
+        self.shown = None
+
+    def patch(self, patch, context):
+        self.play(patch)
@@ -0,0 +1,101 @@
+import logging
+
+import numpy as np
+from PIL import Image
+
+from joedisplay.clock import ClockRenderer, CLOCK_FONT_LARGE, CLOCK_FONT_TALL
+from joedisplay.device import display_greyscale
+from joedisplay.frames import FrameDecoder
+from joedisplay.helpers import make_font
+from joedisplay import Stage
+
+logger = logging.getLogger(__name__)
+
+
+class FrameStage(Stage):
+    """
+    Shows frames rendered by a producer (see `joedisplay.frames` and `joedisplay.render`) as they are,
+    so the display does no layout or rasterization of its own.
+
+    Frames with `"clock": [top, height]` were rendered without their clock, so one is drawn in that
+    row and ticks every second. `valid_for` is how many seconds the frame stays correct, which is when
+    the driver asks for the next one. Data requests carry the `frame_seq` of the last frame decoded,
+    so the producer can send a delta against it.
+    """
+    NAME = 'frame'
+    FONTS = [CLOCK_FONT_LARGE, CLOCK_FONT_TALL]
+
+    def __init__(self, device):
+        self.device = device
+        self.decoder = FrameDecoder(device.width, device.height)
+        self.grey = None
+        self.shown = False
+        self.clock = None
+        self.clock_top = None
+        self.clock_image = None
+
+    @staticmethod
+    def content(event):
+        return {k: v for k, v in event.items() if k not in ('seq', 'base', 'valid_for')}
+
+    @staticmethod
+    def next_refresh(event, now):
+        return event.get('valid_for')
+
+    def request_context(self):
+        if self.decoder.seq is None:
+            return {}
+        return {'frame_seq': self.decoder.seq}
+
+    def start(self):
+        self.shown = False
+        if self.clock is not None:
+            self.clock.shown = None
+
+    def set_clock(self, clock):
+        """
+        Draw a clock in the row `clock` (top, height), or none if `clock` is `None`.
+        """
+        if clock is None:
+            self.clock = None
+            return
+        top, height = clock
+        if self.clock is None or (self.clock_top, self.clock.height) != (top, height):
+            self.clock = ClockRenderer(self.device.width, height, make_font(*CLOCK_FONT_LARGE),
+                                       make_font(*CLOCK_FONT_TALL))
+            self.clock_top = top
+            self.clock_image = Image.new('L', (self.device.width, height))
+
+    def refresh(self):
+        if self.grey is None:
+            return
+        ticked = self.clock is not None and self.clock.should_redraw()
+        if self.shown and not ticked:
+            return
+        grey = self.grey
+        if self.clock is not None:
+            if ticked:
+                self.clock.paste_into(self.clock_image, (0, 0))
+            grey = grey.copy()
+            row = grey[self.clock_top:self.clock_top + self.clock.height]
+            np.right_shift(np.asarray(self.clock_image)[:len(row)], 4, out=row)
+        display_greyscale(self.device, grey)
+        self.shown = True
+
+    def frame_interval(self):
+        if self.clock is None or self.grey is None:
+            return None
+        return 1.0
+
+    def handle(self, event, context):
+        if (event['width'], event['height']) != self.device.size:
+            logger.error("Frame is %sx%s, the display is %sx%s", event['width'], event['height'],
+                         self.device.width, self.device.height)
+            return
+        grey = self.decoder.decode(event)
+        if grey is None:
+            logger.info("Skipping delta frame %s, waiting for a key frame", event.get('seq'))
+            return
+        self.grey = grey
+        self.set_clock(event.get('clock'))
+        self.shown = False
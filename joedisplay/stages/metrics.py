@@ -1,86 +1,147 @@
 import logging
-from luma.core.virtual import terminal
-from luma.core.render import canvas
-from luma.core.virtual import viewport, snapshot, hotspot
+from itertools import zip_longest
+from PIL import Image, ImageDraw
 import time
 
 from joedisplay.helpers import make_font
+from joedisplay.measure import measure
+from joedisplay.sprites import sprites, text_size
 from joedisplay import Stage
 
 
-class MetricRenderer(hotspot):
+class MetricRenderer(object):
+    """
+    Draws a metric, a large value with a label under it, into a column of a page image.
+    Remembers what it last drew, so when only the value changes only the value is redrawn.
+    """
+
     def __init__(self, width, height, title_font, font):
-        super(MetricRenderer, self).__init__(width, height)
         self.width = width
         self.height = height
         self.title_font = title_font
         self.font = font
+        # Fixed so that the label doesn't move when the value changes
+        self.label_top = text_size("0", title_font)[1] + 4
         # State
-        self.value = None
-        self.label = None
-        self.dirty = False
-
-    def set_dirty(self, b):
-        self.dirty = b
-
-    def clear(self):
         self.value = ""
         self.label = ""
-
-    def should_redraw(self):
-        if self.value is None:
-            return False
-        if self.dirty:
-            self.dirty = False
-            return True
-        return False
-
-    def update(self, draw):
-        w, h = draw.textsize(self.value, self.title_font)
-        lw, lh = draw.textsize(self.label, self.font)
-        offset = (self.width - w) // 2
-        label_offset = (self.width - lw) // 2
-        draw.text((offset, 0), self.value, font=self.title_font)
-        draw.text((label_offset, h + 4), self.label, font=self.font)
+        self.drawn_value = None
+        self.drawn_label = None
+
+    def set(self, metric):
+        value = metric.get('value')
+        self.value = "" if value is None else str(value)
+        self.label = metric.get('label') or ""
+
+    @property
+    def dirty(self):
+        return self.value != self.drawn_value or self.label != self.drawn_label
+
+    def draw(self, draw, x, y):
+        if self.value != self.drawn_value:
+            draw.rectangle((x, y, x + self.width - 1, y + self.label_top - 1), fill="black")
+            w = measure(self.value, self.title_font)[0]
+            sprites.draw(draw, (x + (self.width - w) // 2, y),
+                         self.value, self.title_font)
+            self.drawn_value = self.value
+
+        if self.label != self.drawn_label:
+            draw.rectangle((x, y + self.label_top, x + self.width - 1, y + self.height - 1),
+                           fill="black")
+            lw = measure(self.label, self.font)[0]
+            sprites.draw(draw, (x + (self.width - lw) // 2, y + self.label_top),
+                         self.label, self.font)
+            self.drawn_label = self.label
+
+
+class MetricsPage(object):
+    """
+    A page of metrics side by side, kept as an image that is only redrawn where a metric changed.
+    """
+
+    def __init__(self, device, per_page, top, title_font, font):
+        self.top = top
+        self.image = Image.new(device.mode, device.size)
+        self.draw = ImageDraw.Draw(self.image)
+        metric_width = device.width // per_page
+        self.metrics = [MetricRenderer(metric_width, device.height - top, title_font, font)
+                        for _ in range(per_page)]
+
+    def set(self, metric_data):
+        for renderer, metric in zip_longest(self.metrics, metric_data):
+            if renderer is None:
+                break
+            renderer.set(metric or {})
+
+    def render(self):
+        """
+        Redraw the parts that changed. Returns `True` if anything was redrawn.
+        """
+        changed = False
+        x = 0
+        for m in self.metrics:
+            if m.dirty:
+                m.draw(self.draw, x, self.top)
+                changed = True
+            x += m.width
+        return changed
 
 
 class MetricsStage(Stage):
+    """
+    Displays any number of metrics, `PER_PAGE` at a time. If there is more than one page
+    they are shown in turn for `PAGE_INTERVAL` seconds each.
+    Example payload in examples/metrics.json
+    """
     NAME = 'metrics'
+    FONTS = [("OpenSans-Regular.ttf", 9), ("Slackey-Regular.ttf", 28)]
+    PER_PAGE = 4
+    PAGE_INTERVAL = 5
+    TOP = 10
 
     def __init__(self, device):
-        self.viewport = viewport(
-            device, width=device.width, height=device.height + 10)
+        self.device = device
 
         #font_bold = make_font("OpenSans-Bold.ttf", 28)
-        font = make_font("OpenSans-Regular.ttf", 9)
-        font_bold = make_font("Slackey-Regular.ttf", 28)
+        self.font = make_font(*self.FONTS[0])
+        self.font_bold = make_font(*self.FONTS[1])
         #font = make_font("Slackey-Regular.ttf", 9)
 
-        metric_width = int(device.width / 4)
+        self.pages = []
+        self.shown_page = None
 
-        self.metrics = [
-            MetricRenderer(metric_width, device.height, font_bold, font),
-            MetricRenderer(metric_width, device.height, font_bold, font),
-            MetricRenderer(metric_width, device.height, font_bold, font),
-            MetricRenderer(metric_width, device.height, font_bold, font)
-        ]
+    def update(self, metric_data):
+        chunks = [metric_data[i:i + self.PER_PAGE]
+                  for i in range(0, len(metric_data), self.PER_PAGE)] or [[]]
 
-        w = 0
-        for m in self.metrics:
-            self.viewport.add_hotspot(m, (w, 10))
-            w = w + m.width
+        while len(self.pages) < len(chunks):
+            self.pages.append(MetricsPage(self.device, self.PER_PAGE,
+                                          self.TOP, self.font_bold, self.font))
+        del self.pages[len(chunks):]
 
-    def update(self, metric_data):
-        for renderer in self.metrics:
-            renderer.clear()
-        for renderer, metric in zip(self.metrics, metric_data):
-            renderer.value = metric.get('value')
-            renderer.label = metric.get('label')
-        for renderer in self.metrics:
-            renderer.set_dirty(True)
+        for page, chunk in zip(self.pages, chunks):
+            page.set(chunk)
+
+    def current_page(self):
+        # Wall clock, to line up with the frame scheduler's grid
+        return int(time.time() // self.PAGE_INTERVAL) % len(self.pages)
+
+    def start(self):
+        self.shown_page = None
 
     def refresh(self):
-        self.viewport.refresh()
+        if not self.pages:
+            return
+        i = self.current_page()
+        page = self.pages[i]
+        if page.render() or i != self.shown_page:
+            self.device.display(page.image)
+            self.shown_page = i
+
+    def frame_interval(self):
+        if len(self.pages) > 1:
+            return self.PAGE_INTERVAL
+        return None
 
     def handle(self, event, context):
         self.update(event['metrics'])
@@ -1,57 +1,155 @@
 import logging
+import luma.core
 from luma.core.virtual import terminal
 from luma.core.render import canvas
 from luma.core.virtual import viewport
 import time
+from collections import deque
+from textwrap import TextWrapper
+from PIL import Image, ImageDraw
 
 from joedisplay.helpers import make_font
+from joedisplay.scroller import StripScroller
+from joedisplay.sprites import text_size
 from joedisplay import Stage
 
 logger = logging.getLogger(__name__)
 
+# luma.core versions whose terminal keeps its state in the private attributes `TerminalState` uses
+TERMINAL_VERSIONS = ('1.', '2.')
+
+
+class TerminalState(object):
+    """
+    The only place the private state of a luma `terminal` is touched: its line height (`_ch`), and its
+    image and cursor (`_backing_image`, `_cx`, `_cy`), which are moved to match a frame drawn elsewhere.
+    `supported` is false on luma.core versions that aren't known to keep them there.
+    """
+
+    def __init__(self, term):
+        self.term = term
+        self.supported = luma.core.__version__.startswith(TERMINAL_VERSIONS) and all(
+            hasattr(term, a) for a in ('_backing_image', '_cx', '_cy', '_ch'))
+        if not self.supported:
+            logger.warning("Unsupported luma.core %s, animated text will not follow other text",
+                           luma.core.__version__)
+
+    def line_height(self):
+        if self.supported:
+            return self.term._ch
+        return max(text_size(chr(i), self.term.font)[1] for i in range(32, 128))
+
+    def sync(self, image, rows):
+        """
+        Make `image` the terminal's screen, with the cursor at the start of row `rows`.
+        """
+        if self.supported:
+            self.term._backing_image.paste(image)
+            self.term._cx = 0
+            self.term._cy = rows * self.term._ch
+
 
 class TerminalStage(Stage):
     """
     Simple stage implementation that wraps luma.core's terminal utility.
+    Messages are printed a character at a time, unless the event has `"animate": false`, in which
+    case the whole message is wrapped, scrolled and shown in a single frame.
     Example payload in examples/text.json
     """
     NAME = 'text'
+    SCROLLBACK = 50
 
     def __init__(self, device):
+        self.device = device
         self.term = terminal(device, None)
+        self.term_state = TerminalState(self.term)
+        self.font = self.term.font
+        # Same line height as the terminal, so the two modes can share the screen
+        self.line_height = self.term_state.line_height()
+        # The terminal keeps the cursor on this row and scrolls the lines above it
+        self.cursor_row = max(0, -(-device.height // self.line_height) - 2)
+        self.wrapper = TextWrapper(width=self.term.width, break_long_words=True)
+        self.lines = deque(maxlen=self.SCROLLBACK)
+
+    def start(self):
+        self.term.flush()
+
+    def wrap(self, message):
+        lines = []
+        for line in message.split('\n'):
+            lines.extend(self.wrapper.wrap(line) or [''])
+        return lines
+
+    def show(self):
+        """
+        Draw the last lines of the scrollback and display them as one frame.
+        """
+        shown = list(self.lines)[-self.cursor_row:] if self.cursor_row else []
+        image = Image.new(self.device.mode, self.device.size)
+        draw = ImageDraw.Draw(image)
+        for row, line in enumerate(shown):
+            draw.text((0, row * self.line_height), line, font=self.font, fill="white")
+        self.device.display(image)
+
+        # Put the terminal in the same state, so animated messages carry on underneath
+        self.term_state.sync(image, len(shown))
 
     def handle(self, event, context):
-        self.term.println(event['message'])
+        message = event['message']
+        self.lines.extend(self.wrap(message))
+        if event.get('animate', True):
+            self.term.println(message)
+        else:
+            self.show()
 
 
 class ScrollStage(Stage):
     """
-    Scrolling text stage implementation. Borrowed from luma.examples.
+    Scrolling text stage implementation. Originally borrowed from luma.examples.
     https://github.com/rm-hull/luma.examples
+
+    The message is rasterized once into a `StripScroller` and the frame scheduler crops a window out of
+    it every `FRAME_INTERVAL` seconds. A new message replaces the one scrolling, unless the event has
+    `"queue": true`, in which case it plays after the messages ahead of it.
+    `"speed"` is in pixels per second.
     """
     NAME = 'scroll'
+    FONTS = [('FreePixel.ttf', 14)]
+    FRAME_INTERVAL = 0.025
+    SPEED = 40
 
     def __init__(self, device):
         self.device = device
+        self.scroller = None
+        self.pending = deque()
 
-    def scroll_message(self, full_text, font=None, speed=1):
-        device = self.device
-        x = device.width
+    def stop(self):
+        self.scroller = None
+        self.pending.clear()
 
-        with canvas(device) as draw:
-            w, h = draw.textsize(full_text, font)
+    def scroll_message(self, full_text, font=None, speed=SPEED):
+        device = self.device
+        self.scroller = StripScroller.for_text(
+            full_text, font, device.width, device.height, mode=device.mode, speed=speed)
 
-        virtual = viewport(device, width=max(
-            device.width, w + x + x), height=max(h, device.height))
-        with canvas(virtual) as draw:
-            draw.text((x, 0), full_text, font=font, fill="white")
+    def refresh(self):
+        if self.scroller is None:
+            return
+        self.device.display(self.scroller.frame())
+        if self.scroller.done:
+            self.scroller = None
+            if self.pending:
+                self.scroll_message(*self.pending.popleft())
 
-        i = 0
-        while i < x + w:
-            virtual.set_position((i, 0))
-            i += speed
-            time.sleep(0.025)
+    def frame_interval(self):
+        if self.scroller is None:
+            return None
+        return self.FRAME_INTERVAL
 
     def handle(self, event, context):
-        font = make_font('FreePixel.ttf', 14)
-        self.scroll_message(event['message'], font=font)
+        font = make_font(*self.FONTS[0])
+        message = (event['message'], font, event.get('speed', self.SPEED))
+        if event.get('queue') and self.scroller is not None:
+            self.pending.append(message)
+        else:
+            self.scroll_message(*message)
@@ -0,0 +1,47 @@
+import logging
+import time
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class RateCounter(object):
+    """
+    Accumulates named counters (e.g. pixels and bytes pushed to the device) and reports them
+    as per-second rates over a sliding window. Logs the rates every `interval` seconds.
+    """
+
+    def __init__(self, name, interval=10):
+        self.name = name
+        self.interval = interval
+        self.totals = {}
+        self._window = {}
+        self._window_start = time.monotonic()
+        self._rates = {}
+        self._lock = Lock()
+
+    def add(self, **amounts):
+        with self._lock:
+            for k, v in amounts.items():
+                self.totals[k] = self.totals.get(k, 0) + v
+                self._window[k] = self._window.get(k, 0) + v
+            self._roll()
+
+    def rates(self):
+        """
+        Per-second rates for the last complete window.
+        """
+        with self._lock:
+            self._roll()
+            return dict(self._rates)
+
+    def _roll(self):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.interval:
+            return
+        self._rates = {k: v / elapsed for k, v in self._window.items()}
+        self._window = {k: 0 for k in self._window}
+        self._window_start = now
+        logger.debug("%s: %s", self.name, ", ".join(
+            f"{k}/s={v:.1f}" for k, v in sorted(self._rates.items())))
@@ -0,0 +1,131 @@
+import logging
+import time
+
+import numpy as np
+
+"""
+Stage transitions. The outgoing and incoming frames are captured once, as the arrays a
+`FrameDiffDevice` keeps, and every intermediate frame is generated up front with NumPy, so playing
+a transition is only a matter of sending frames. Neither stage is drawn while it plays.
+
+Run `python -m joedisplay.transition` for a micro-benchmark of each effect.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def wipe(before, after, progress):
+    """
+    The incoming frame is revealed from the left.
+    """
+    x = int(round(before.shape[1] * progress))
+    frame = before.copy()
+    frame[:, :x] = after[:, :x]
+    return frame
+
+
+def slide(before, after, progress):
+    """
+    The incoming frame slides in from the right, pushing the outgoing one out to the left.
+    """
+    width = before.shape[1]
+    x = int(round(width * progress))
+    frame = np.empty_like(before)
+    frame[:, :width - x] = before[:, x:]
+    frame[:, width - x:] = after[:, :x]
+    return frame
+
+
+def crossfade(before, after, progress):
+    """
+    Blends the two frames. Needs a greyscale or colour frame, not a 1-bit one.
+    """
+    b = before.astype(np.int16)
+    mix = b + ((after.astype(np.int16) - b) * int(round(progress * 256)) >> 8)
+    return mix.astype(before.dtype)
+
+
+EFFECTS = {'wipe': wipe, 'slide': slide, 'crossfade': crossfade}
+
+
+class Transition(object):
+    """
+    Plays `effect` from the `before` frame to the `after` frame over `duration` seconds on a
+    `FrameDiffDevice`, at up to `fps` frames per second.
+
+    Frames are generated when the transition is created. If generating them all would take longer
+    than `budget` seconds of CPU, fewer frames are generated, evenly spaced, and each is shown for longer.
+    A crossfade on a 4-bit greyscale panel never needs more frames than there are grey levels.
+
+    Meant to be played by the `FrameScheduler`, which calls `refresh()` every `frame_interval()`
+    until it is `done`.
+    """
+
+    def __init__(self, device, before, after, effect='wipe', duration=0.5, fps=25, budget=0.1,
+                 clock=time.monotonic):
+        self.device = device
+        self.duration = duration
+        self.clock = clock
+        self.started = None
+        self.shown = None
+
+        if before.dtype == np.bool_ and effect == 'crossfade':
+            # Nothing to blend on a 1-bit display
+            effect = 'wipe'
+        self.effect = effect
+        render = EFFECTS[effect]
+
+        count = max(1, int(round(duration * fps)))
+        if effect == 'crossfade' and getattr(device, 'framebuffer', None) is not None:
+            count = min(count, 16)
+
+        start = time.process_time()
+        first = render(before, after, 1.0 / count)
+        per_frame = time.process_time() - start
+        if per_frame > 0:
+            count = max(1, min(count, int(budget / per_frame)))
+
+        self.frames = [first] if count > 1 else []
+        self.frames.extend(render(before, after, i / count) for i in range(len(self.frames) + 1, count))
+        self.frames.append(after)
+        self.build_time = time.process_time() - start
+        logger.debug("Generated %d %s frames in %.1fms", len(self.frames), effect, self.build_time * 1000)
+
+    @property
+    def done(self):
+        return self.shown == len(self.frames) - 1
+
+    def frame_interval(self):
+        return self.duration / len(self.frames)
+
+    def refresh(self):
+        now = self.clock()
+        if self.started is None:
+            self.started = now
+        # By elapsed time rather than by frame count, so the duration holds even if frames are late
+        i = min(int((now - self.started) / self.duration * len(self.frames)), len(self.frames) - 1)
+        if i != self.shown:
+            self.device.display_frame(self.frames[i])
+            self.shown = i
+
+
+if __name__ == "__main__":
+    from joedisplay.framebuffer import GreyscaleFramebuffer
+    from PIL import Image, ImageDraw
+
+    def sample(text):
+        image = Image.new('RGB', (256, 64))
+        ImageDraw.Draw(image).text((10, 20), text * 8, fill="white")
+        return image
+
+    framebuffer = GreyscaleFramebuffer(256, 64)
+    before = framebuffer.convert(sample("before "))
+    after = framebuffer.convert(sample("after "))
+
+    runs = 200
+    for name, render in sorted(EFFECTS.items()):
+        start = time.perf_counter()
+        for i in range(runs):
+            render(before, after, i / runs)
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {elapsed / runs * 1000:.3f}ms per 256x64 4-bit frame")
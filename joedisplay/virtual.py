@@ -0,0 +1,97 @@
+from luma.core.virtual import viewport
+
+from .device import write_window
+from .stats import RateCounter
+
+"""
+Virtual devices that only push the parts of the frame that changed.
+"""
+
+
+def union(boxes):
+    """
+    Smallest box containing all of `boxes`, or `None` if there are none.
+    """
+    boxes = list(boxes)
+    if not boxes:
+        return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def clip(box, bounds):
+    """
+    Intersect `box` with `bounds`. Returns `None` if they do not overlap.
+    """
+    left, top = max(box[0], bounds[0]), max(box[1], bounds[1])
+    right, bottom = min(box[2], bounds[2]), min(box[3], bounds[3])
+    if left >= right or top >= bottom:
+        return None
+    return (left, top, right, bottom)
+
+
+class DamageTrackingViewport(viewport):
+    """
+    A viewport that records which regions of the backing image were redrawn and only
+    pushes those to the device.
+
+    Hotspots may implement `damage()`, returning a list of `(left, top, right, bottom)` boxes
+    relative to the hotspot that changed in the frame about to be drawn. It is called after
+    `should_redraw()` returns `True` and before the hotspot is drawn. Hotspots without it
+    damage their whole area.
+
+    Nothing is sent to the device if nothing was damaged.
+    """
+
+    def __init__(self, device, width, height, stats=None):
+        super(DamageTrackingViewport, self).__init__(device, width, height)
+        self.stats = stats or RateCounter('viewport')
+        self._damage = []
+
+    def invalidate(self, box=None):
+        """
+        Mark `box` (in viewport coordinates), or the whole viewport, as needing a push.
+        """
+        self._damage.append(box or (0, 0, self.width, self.height))
+
+    def set_position(self, xy):
+        self._position = xy
+        self.invalidate()
+        self.refresh()
+
+    def display(self, image):
+        self._backing_image.paste(image)
+        self.invalidate()
+        self.refresh()
+
+    def refresh(self, force=False):
+        if force:
+            self.invalidate()
+
+        for hotspot, xy in self._hotspots:
+            if hotspot.should_redraw() and self.is_overlapping_viewport(hotspot, xy):
+                self._damage.extend(self._hotspot_damage(hotspot, xy))
+                hotspot.paste_into(self._backing_image, xy)
+
+        if not self._damage:
+            return
+
+        left, top, right, bottom = self._crop_box()
+        box = clip(union(self._damage), (left, top, right, bottom))
+        self._damage = []
+        if box is None:
+            return
+
+        # Translate into device coordinates
+        box = (box[0] - left, box[1] - top, box[2] - left, box[3] - top)
+        im = self._backing_image.crop(box=(left, top, right, bottom))
+        pixels, nbytes = write_window(self._device, im, box)
+        self.stats.add(pixels=pixels, bytes=nbytes)
+
+    def _hotspot_damage(self, hotspot, xy):
+        x, y = xy
+        damage = getattr(hotspot, 'damage', None)
+        boxes = damage() if damage else None
+        if not boxes:
+            boxes = [(0, 0, hotspot.width, hotspot.height)]
+        return [(x + l, y + t, x + r, y + b) for l, t, r, b in boxes]
@@ -9,7 +9,7 @@ from subprocess import check_output
 
 from joedisplay import get_device, StageController
 from transport.stages import TrainDepartureBoardStage
-from joedisplay.stages import MetricsStage
+from joedisplay.stages import MetricsStage, AnimationStage, FrameStage
 
 """
 Display exposed as an Redis channel subscriber. Will render any `Stage` registered within the controller.
@@ -35,6 +35,9 @@ term.flush()
 controller = StageController(device)
 controller.add_stage(TrainDepartureBoardStage)
 controller.add_stage(MetricsStage)
+controller.add_stage(AnimationStage)
+controller.add_stage(FrameStage)
+controller.preload_fonts()
 
 if __name__ == "__main__":
     # Subscribe to Redis topic for display updates
@@ -48,7 +51,7 @@ if __name__ == "__main__":
         if message is not None:
             try:
                 event = json.loads(message['data'])
-                controller.event_handler(event, None)
+                controller.submit(event)
             except Exception as e:
                 logger.exception(e)
         time.sleep(0.025)
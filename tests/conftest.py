@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The repository isn't installed as a package, so import joedisplay and transport from the checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
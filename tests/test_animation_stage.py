@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('PIL')
+pytest.importorskip('luma.core')
+
+from luma.core.device import dummy
+
+from joedisplay.animation import HEADER, MAGIC
+from joedisplay.stages.animation import AnimationStage
+
+
+def write_animation(path, width=256, height=64, frames=2):
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, width, height, frames, 10))
+        f.write(bytes(width * height // 2 * frames))
+
+
+@pytest.fixture
+def stage(tmp_path, monkeypatch):
+    directory = tmp_path / 'animations'
+    directory.mkdir()
+    monkeypatch.setattr(AnimationStage, 'DIRECTORY', str(directory))
+    return AnimationStage(dummy(width=256, height=64))
+
+
+def test_opens_file_in_directory(stage):
+    write_animation(os.path.join(AnimationStage.DIRECTORY, 'logo.jda'))
+    assert stage.open('logo.jda')
+    assert len(stage.animation) == 2
+    assert not stage.open('logo.jda')
+
+
+@pytest.mark.parametrize('name', ['../secret.jda', 'sub/../../secret.jda'])
+def test_rejects_names_outside_directory(stage, name):
+    write_animation(os.path.join(os.path.dirname(AnimationStage.DIRECTORY), 'secret.jda'))
+    with pytest.raises(ValueError):
+        stage.open(name)
+    assert stage.animation is None
+
+
+def test_rejects_absolute_names(stage):
+    path = os.path.join(AnimationStage.DIRECTORY, 'logo.jda')
+    write_animation(path)
+    with pytest.raises(ValueError):
+        stage.open(path)
+
+
+def test_rejects_links_out_of_directory(stage):
+    outside = os.path.join(os.path.dirname(AnimationStage.DIRECTORY), 'secret.jda')
+    write_animation(outside)
+    os.symlink(outside, os.path.join(AnimationStage.DIRECTORY, 'link.jda'))
+    with pytest.raises(ValueError):
+        stage.open('link.jda')
+
+
+def test_handle_ignores_rejected_names(stage):
+    stage.handle({'stage': 'animation', 'file': '/etc/passwd'}, {})
+    assert stage.animation is None
@@ -0,0 +1,101 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('PIL')
+pytest.importorskip('luma.core')
+
+from PIL import Image, ImageDraw
+from luma.core.device import dummy
+
+from joedisplay.device import FrameDiffDevice
+from joedisplay.framebuffer import GreyscaleFramebuffer
+
+
+class RecordingSerial(object):
+    """
+    Serial interface that keeps what luma writes to the panel.
+    """
+
+    def __init__(self):
+        self.commands = []
+        self.writes = []
+
+    def command(self, *cmd):
+        self.commands.append(cmd)
+
+    def data(self, data):
+        self.writes.append(list(data))
+
+    def cleanup(self):
+        pass
+
+
+def frame(box=None, fill="white"):
+    image = Image.new('RGB', (256, 64))
+    if box is not None:
+        ImageDraw.Draw(image).rectangle(box, fill=fill)
+    return image
+
+
+def test_skips_identical_frames():
+    device = FrameDiffDevice(dummy(width=256, height=64))
+    device.display(frame((10, 10, 20, 20)))
+    assert device.display_window(frame((10, 10, 20, 20)), (0, 0, 256, 64)) == (0, 0)
+    assert device.stats.totals['frames'] == 2
+    assert device.stats.totals['skipped'] == 1
+
+
+def test_sends_changes_to_dummy_device_in_full():
+    inner = dummy(width=256, height=64)
+    device = FrameDiffDevice(inner)
+    device.display(frame())
+    device.display(frame((100, 20, 109, 29)))
+    assert inner.image.getbbox() == (100, 20, 110, 30)
+    assert device.stats.totals['window'] < device.stats.totals['full']
+
+
+def test_changed_window_is_bounding_box_of_changes():
+    device = FrameDiffDevice(dummy(width=256, height=64))
+    device.display(frame())
+    changed = frame((30, 5, 39, 9))
+    ImageDraw.Draw(changed).point((200, 40), fill="white")
+    full = (0, 0, 256, 64)
+    assert device._changed_window(device.frame(changed), full) == (30, 5, 201, 41)
+    # Only looks inside the box it is given
+    assert device._changed_window(device.frame(changed), (0, 0, 100, 64)) == (30, 5, 40, 10)
+
+
+def test_writes_packed_windows_to_greyscale_panel():
+    ssd1322 = pytest.importorskip('luma.oled.device').ssd1322
+
+    serial = RecordingSerial()
+    device = FrameDiffDevice(ssd1322(serial, width=256, height=64))
+    assert device.framebuffer is not None
+    device.display(frame())
+    serial.writes = []
+
+    image = frame((101, 20, 110, 29), fill=(128, 128, 128))
+    pixels, nbytes = device.display_window(image, (0, 0, 256, 64))
+    # Column and row addresses, then the pixels
+    assert len(serial.writes) == 3
+    written = serial.writes[-1]
+    # The window is widened to whole 4-pixel column addresses
+    assert pixels == 12 * 10
+    assert nbytes == len(written) == 60
+
+    framebuffer = GreyscaleFramebuffer(256, 64)
+    expected = framebuffer.pack(framebuffer.convert(image), (100, 20, 112, 30))
+    assert written == expected.tolist()
+
+
+def test_capture_keeps_frames_off_the_device():
+    inner = dummy(width=256, height=64)
+    device = FrameDiffDevice(inner)
+    assert not device.start_capture()
+    device.display(frame())
+    assert device.start_capture()
+    device.display(frame((0, 0, 9, 9)))
+    before, after = device.end_capture()
+    assert inner.image.getbbox() is None
+    assert not before.any()
+    assert after[:10, :10].all()
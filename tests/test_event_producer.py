@@ -0,0 +1,135 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('PIL')
+pytest.importorskip('luma.core')
+
+from luma.core.device import dummy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the unpacked Lambda bundle, importing the handler the way Lambda does
+HANDLER = """
+import json
+import event_producer
+from transport_api import TrainDisplayBoardDecorator
+
+event_producer._api = TrainDisplayBoardDecorator(event_producer.RecordedTransportAPI('sample-live.json'))
+stub = event_producer.StubPublisher()
+requests = [{'client_id': 'plain', 'data': {'station_code': 'NCL'}},
+            {'client_id': 'render', 'data': {'station_code': 'NCL', 'render': True}}]
+result = event_producer.load_departures_batch_handler(requests, None, publisher=stub)
+print(json.dumps({'result': result, 'published': stub.published}))
+"""
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    """
+    Build the Lambda zip with package-lambda.sh (without vendored dependencies) and unpack it.
+    """
+    if shutil.which('zip') is None:
+        pytest.skip("zip is not installed")
+    checkout = tmp_path / 'checkout'
+    ignore = shutil.ignore_patterns('__pycache__', 'vendor', '*.zip')
+    for package in ('joedisplay', 'transport'):
+        shutil.copytree(os.path.join(ROOT, package), str(checkout / package), ignore=ignore)
+    (checkout / 'transport' / 'vendor').mkdir()
+    (checkout / 'transport' / 'vendor' / 'README').write_text('dependencies go here\n')
+    subprocess.run(['sh', 'package-lambda.sh'], cwd=str(checkout / 'transport'), check=True,
+                   stdout=subprocess.DEVNULL)
+
+    unpacked = tmp_path / 'lambda'
+    with zipfile.ZipFile(str(checkout / 'transport' / 'event-producer-lambda.zip')) as z:
+        z.extractall(str(unpacked))
+    return unpacked
+
+
+def test_bundle_has_handler_and_packages(bundle):
+    for name in ('event_producer.py', 'transport_api.py', 'joedisplay/render.py',
+                 'joedisplay/fonts', 'transport/stages.py'):
+        assert (bundle / name).exists(), name
+    assert not list(bundle.glob('**/__pycache__'))
+
+
+def test_batch_handler_imports_from_bundle(bundle):
+    shutil.copy(os.path.join(ROOT, 'transport', 'sample-live.json'), str(bundle))
+    output = subprocess.run([sys.executable, '-c', HANDLER], cwd=str(bundle), check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    published = json.loads(output.splitlines()[-1])
+
+    assert published['result'] == {'requests': 2, 'stations': 1, 'published': 2}
+    (plain, departures), (render, frame) = published['published']
+    assert plain == 'display/plain/input'
+    assert departures['stage'] == 'train-display-board'
+    assert departures['data']['departures']
+    assert render == 'display/render/input'
+    assert frame['stage'] == 'frame'
+    assert frame['encoding'] in ('rle', 'raw')
+    assert frame['clock'] == [50, 14]
+
+
+def departures(first, now=None):
+    now = now or datetime.now()
+    return {'stage': 'train-display-board', 'data': {'valid_for': 300, 'departures': [
+        {'departure_time': (now + timedelta(minutes=5 * i + 3)).strftime('%H:%M'),
+         'destination': first if i == 0 else f"Destination {i}", 'platform': str(i), 'status': 'On time'}
+        for i in range(8)]}}
+
+
+@pytest.fixture
+def render_frame(monkeypatch):
+    from transport import event_producer
+    monkeypatch.setattr(event_producer, 'rendered', {})
+    return event_producer.render_frame
+
+
+def test_render_sends_deltas_to_displays_with_the_previous_frame(render_frame):
+    from joedisplay.device import FrameDiffDevice
+    from joedisplay.stages.frame import FrameStage
+
+    key = ('NCL', None, None)
+    first = render_frame(key, departures('Edinburgh'))
+    assert first['encoding'] != 'delta'
+    assert 0 < first['valid_for'] <= 300
+
+    stage = FrameStage(FrameDiffDevice(dummy(width=256, height=64)))
+    stage.handle(first, {})
+    stage.refresh()
+
+    delta = render_frame(key, departures('York'), stage.request_context()['frame_seq'])
+    assert delta['encoding'] == 'delta'
+    assert len(delta['data']) < len(first['data'])
+    stage.handle(delta, {})
+    assert stage.request_context() == {'frame_seq': delta['seq']}
+
+    # A display without the previous frame gets the same frame whole
+    keyframe = render_frame(key, departures('York'))
+    assert keyframe['encoding'] != 'delta'
+    assert keyframe['seq'] == delta['seq']
+
+
+def test_frame_stage_draws_the_clock(render_frame):
+    from joedisplay.stages.frame import FrameStage
+
+    device = dummy(width=256, height=64)
+    stage = FrameStage(device)
+    stage.handle(render_frame(('NCL', None, None), departures('Edinburgh')), {})
+    stage.refresh()
+    assert stage.frame_interval() == 1.0
+    clock_row = device.image.convert('L').crop((0, 50, 256, 64))
+    assert clock_row.getbbox() is not None
+
+
+def test_render_falls_back_to_departures_while_calling_points_scroll(render_frame):
+    event = departures('Edinburgh')
+    event['data']['departures'][0]['calling_at'] = [f"Station {i}" for i in range(20)]
+    assert render_frame(('NCL', None, None), event) is event
@@ -0,0 +1,59 @@
+import pytest
+
+# Importing joedisplay loads the display stack
+pytest.importorskip('numpy')
+pytest.importorskip('PIL')
+pytest.importorskip('luma.core')
+
+from joedisplay.events import EventQueue, coalesce_key
+
+
+def test_coalesce_key():
+    assert coalesce_key({'stage': 'text'}) == 'text'
+    assert coalesce_key({'stage': 'text', 'coalesce': False}) is None
+    assert coalesce_key({'stage': 'scroll', 'queue': True}) is None
+    assert coalesce_key({'stage': 'train-display-board', 'patch': {}}) is None
+
+
+def test_latest_event_for_a_stage_wins_and_moves_to_the_back():
+    queue = EventQueue()
+    queue.offer({'stage': 'text', 'message': 'one'})
+    queue.offer({'stage': 'clock'})
+    queue.offer({'stage': 'text', 'message': 'two'})
+    assert len(queue) == 2
+    assert queue.coalesced == 1
+    assert queue.take(0)[0] == {'stage': 'clock'}
+    assert queue.take(0)[0] == {'stage': 'text', 'message': 'two'}
+
+
+def test_unkeyed_events_are_all_kept():
+    queue = EventQueue()
+    for i in range(3):
+        queue.offer({'stage': 'text', 'message': str(i), 'coalesce': False})
+    assert [queue.take(0)[0]['message'] for _ in range(3)] == ['0', '1', '2']
+
+
+def test_full_queue_rejects_without_blocking():
+    queue = EventQueue(maxsize=2)
+    assert queue.offer({'stage': 'a'})
+    assert queue.offer({'stage': 'b'})
+    assert not queue.offer({'stage': 'c'})
+    # Replacing a queued event doesn't need room
+    assert queue.offer({'stage': 'a', 'n': 2})
+    assert (queue.accepted, queue.rejected) == (3, 1)
+
+
+def test_requeue_goes_to_the_front_unless_superseded():
+    queue = EventQueue()
+    queue.offer({'stage': 'b'})
+    assert queue.requeue({'stage': 'a'}, 'context')
+    assert queue.take(0) == ({'stage': 'a'}, 'context')
+
+    queue.offer({'stage': 'a', 'n': 2})
+    assert not queue.requeue({'stage': 'a', 'n': 1})
+    assert queue.take(0)[0] == {'stage': 'b'}
+    assert queue.take(0)[0] == {'stage': 'a', 'n': 2}
+
+
+def test_take_times_out_when_empty():
+    assert EventQueue().take(0.01) is None
@@ -0,0 +1,89 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('PIL')
+pytest.importorskip('luma.core')
+
+from PIL import Image, ImageDraw
+
+from joedisplay.framebuffer import GreyscaleFramebuffer
+from joedisplay.frames import FrameDecoder, FrameEncoder, decode_rle, encode_rle
+
+
+@pytest.mark.parametrize('data', [
+    [],
+    [7],
+    [0] * 8192,
+    [1] * 255 + [2] * 256 + [3] * 511,
+    list(range(256)) * 3,
+])
+def test_rle_round_trip(data):
+    data = np.array(data, dtype=np.uint8)
+    encoded = encode_rle(data)
+    pairs = np.frombuffer(encoded, dtype=np.uint8).reshape(-1, 2)
+    assert (pairs[:, 0] > 0).all()
+    assert np.array_equal(decode_rle(encoded, data.size), data)
+
+
+def test_decode_rle_checks_size():
+    with pytest.raises(ValueError):
+        decode_rle(encode_rle(np.zeros(10, dtype=np.uint8)), 12)
+
+
+def board_image(text):
+    image = Image.new('RGB', (256, 64))
+    draw = ImageDraw.Draw(image)
+    for i in range(0, 256, 16):
+        draw.rectangle((i, 40, i + 15, 63), fill=(i, i, i))
+    draw.text((10, 10), text, fill="white")
+    return image
+
+
+def test_pack_matches_luma():
+    ssd1322 = pytest.importorskip('luma.oled.device').ssd1322
+    from luma.core.interface.serial import noop
+
+    device = ssd1322(noop(), width=256, height=64)
+    image = board_image("14:25 Edinburgh Waverley")
+    buf = bytearray(device.width * device.height >> 1)
+    device._populate(buf, image.getdata())
+
+    framebuffer = GreyscaleFramebuffer(256, 64)
+    packed = framebuffer.pack(framebuffer.convert(image))
+    assert packed.tobytes() == bytes(buf)
+    assert np.array_equal(framebuffer.unpack(packed), framebuffer.convert(image))
+
+
+def test_encoder_sends_deltas_and_decoder_applies_them():
+    framebuffer = GreyscaleFramebuffer(256, 64)
+    encoder = FrameEncoder()
+    decoder = FrameDecoder()
+
+    first = framebuffer.convert(board_image("14:25 Edinburgh"))
+    key = encoder.encode(first)
+    assert key['encoding'] in ('rle', 'raw')
+    assert np.array_equal(decoder.decode(key), first)
+    assert encoder.encode(first) is None
+
+    second = framebuffer.convert(board_image("14:25 York"))
+    delta = encoder.encode(second)
+    assert delta['encoding'] == 'delta'
+    assert delta['base'] == key['seq']
+    assert delta['coalesce'] is False
+    assert np.array_equal(decoder.decode(delta), second)
+
+    # A display without the base frame ignores the delta, and can start from a key frame of it
+    fresh = FrameDecoder()
+    assert fresh.decode(delta) is None
+    keyframe = encoder.keyframe()
+    assert keyframe['seq'] == delta['seq']
+    assert np.array_equal(fresh.decode(keyframe), second)
+
+
+def test_encoder_sends_key_frames_at_interval():
+    framebuffer = GreyscaleFramebuffer(256, 64)
+    encoder = FrameEncoder(keyframe_interval=2)
+    encodings = [encoder.encode(framebuffer.convert(board_image(f"14:2{i}")))['encoding'] for i in range(5)]
+    assert encodings[0] != 'delta'
+    assert encodings[1:3] == ['delta', 'delta']
+    assert encodings[3] != 'delta'
@@ -0,0 +1,135 @@
+import json
+
+import pytest
+
+requests = pytest.importorskip('requests')
+
+from transport.transport_api import (JSONCursor, TransportAPI, TrainDisplayBoardDecorator, _sample_response,
+                                     decode_live_departures)
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Response(object):
+    def __init__(self, status_code, text='', headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class Session(object):
+    """
+    Answers with `responses` in turn. `None` is a connection failure.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = 0
+
+    def get(self, url, params, headers, timeout):
+        self.requests += 1
+        response = self.responses.pop(0)
+        if response is None:
+            raise requests.ConnectionError()
+        return response
+
+
+def client(*responses, **options):
+    clock = Clock()
+    api = TransportAPI('id', 'key', ttl=60, stale_for=300, background=False, clock=clock, **options)
+    api.session = Session(*responses)
+    return api, clock
+
+
+def test_falls_back_to_cached_response_while_stale():
+    api, clock = client(Response(200, '{"a": 1}'), None)
+    api.load_departures_text('NCL')
+    clock.now += 200
+    assert api.load_departures_text('NCL') == '{"a": 1}'
+    assert api.age('NCL') == 200
+
+
+def test_does_not_fall_back_to_response_older_than_stale_for():
+    api, clock = client(Response(200, '{"a": 1}'), None)
+    api.load_departures_text('NCL')
+    clock.now += 60 + 300 + 1
+    with pytest.raises(TransportAPI.BadRequestException):
+        api.load_departures_text('NCL')
+
+
+def test_valid_for_is_shortened_by_age():
+    api, clock = client(Response(200, _sample_response(departures=5)), None)
+    board = TrainDisplayBoardDecorator(api)
+    assert board.load_departures_for_station('NCL')['data']['valid_for'] == board.VALID_FOR
+    clock.now += 200
+    assert board.load_departures_for_station('NCL')['data']['valid_for'] == board.VALID_FOR - 200
+
+
+def test_cache_drops_least_recently_used():
+    api, clock = client(*[Response(200, f'{{"n": {i}}}') for i in range(3)], cache_size=2)
+    api.load_departures_text('NCL')
+    api.load_departures_text('EDB')
+    api.load_departures_text('NCL')
+    api.load_departures_text('YRK')
+    assert list(api.cache) == [('NCL', None), ('YRK', None)]
+    assert api.stats['evicted'] == 1
+
+
+class Stations(object):
+    def __init__(self, responses):
+        self.responses = responses
+
+    def load_departures_text(self, departure_station_code, calling_at=None):
+        return self.responses[departure_station_code]
+
+
+def test_bad_response_for_one_station_does_not_stop_the_others():
+    board = TrainDisplayBoardDecorator(Stations({
+        'NCL': _sample_response(departures=5), 'EDB': '{"station_code": "EDB"}', 'YRK': '<html>'}))
+    payloads = dict(board.load_departures_for_stations(['NCL', 'EDB', 'YRK']))
+    assert payloads['NCL']['stage'] == 'train-display-board'
+    assert payloads['EDB']['stage'] == 'text'
+    assert payloads['YRK']['stage'] == 'text'
+
+
+def test_cursor_decodes_chosen_values_and_skips_the_rest():
+    text = ' { "skip": {"a": [1, "]}", {"b": "\\"{"}]}, "n": 3 , "list": [ {"x": 1}, [], "y" ], "empty": {} } '
+    cursor = JSONCursor(text)
+    seen = {}
+    for key in cursor.members():
+        if key == 'n':
+            seen[key] = cursor.value()
+        elif key == 'list':
+            seen[key] = [cursor.value() for _ in cursor.elements()]
+    assert seen == {'n': 3, 'list': [{'x': 1}, [], 'y']}
+    assert cursor.peek() == ''
+
+
+def test_cursor_rejects_malformed_json():
+    with pytest.raises(ValueError):
+        list(JSONCursor('{"a": 1 "b": 2}').members())
+    with pytest.raises(ValueError):
+        for _ in JSONCursor('{"a": [1, 2').members():
+            pass
+
+
+def test_streamed_departures_match_full_decode():
+    board = TrainDisplayBoardDecorator(None)
+    text = _sample_response(departures=50)
+    for platform in (None, '4'):
+        assert (board.display_payload(decode_live_departures(text), platform, 4) ==
+                board.display_payload(json.loads(text), platform, 4))
+
+
+def test_decode_needs_departures():
+    with pytest.raises(ValueError):
+        decode_live_departures('{"station_code": "NCL"}')
@@ -1,21 +1,208 @@
 import json
-import boto3
+import logging
 import os
-from transport_api import TransportAPI, TrainDisplayBoardDecorator
+import time
+from collections import OrderedDict
+from datetime import datetime
 
-client = boto3.client('iot-data')
+logger = logging.getLogger(__name__)
 
-api = TrainDisplayBoardDecorator(TransportAPI(os.environ.get(
-    "TRANSPORTAPI_APP_ID"), os.environ.get("TRANSPORTAPI_APP_KEY")))
+"""
+Lambda handlers that load departures for displays and publish them to their topics.
+
+`load_departures_batch_handler` takes a batch of data requests, as sent by displays to
+`display/producers/train-display-board`, either as a list, as `{"requests": [...]}` or as an SQS batch.
+Requests are grouped by station, each station is fetched once (stations concurrently) and every
+display event is published in the same pass. `load_departures_for_station_handler` is a batch of one.
+
+Displays that ask for `"render": true` in their data are sent a rendered `frame` event instead of the
+departures, so they do no rendering themselves. Rendering needs the `joedisplay` and `transport`
+packages and their dependencies in the Lambda bundle (see `package-lambda.sh`), and is only imported
+for those requests. Each station is rendered once and the frame is reused for every display showing
+it until the departures change or the first train on it leaves. The board is rendered without its
+clock, which the display draws. Displays that have the previous frame are sent a delta. While the
+calling points scroll, and whenever rendering fails, displays are sent the departures as usual.
+
+Nothing is created at import, to keep cold starts short: the Transport API client on the first request
+and the `iot-data` client (and boto3 itself) on the first publish.
+
+Try it locally, without credentials or AWS, with a stubbed publisher and a saved response:
+
+    python event_producer.py sample-live.json
+
+`sample-live.json` is synthetic: a Newcastle `live.json` made up in the API's format. Record a real
+one with `python transport_api.py --record NCL > live.json`.
+"""
+
+# Departures sent to each display. The board promotes the rest as trains depart.
+TOP = 8
+
+_api = None
+
+# (station code, calling_at, platform) -> (renderer, last display event, (frame, key frame), expiry)
+rendered = {}
+
+
+def get_api():
+    global _api
+    if _api is None:
+        from transport_api import TransportAPI, TrainDisplayBoardDecorator
+        # No background revalidation, as Lambda freezes threads between invocations
+        _api = TrainDisplayBoardDecorator(TransportAPI(os.environ.get(
+            "TRANSPORTAPI_APP_ID"), os.environ.get("TRANSPORTAPI_APP_KEY"), background=False))
+    return _api
+
+
+class IoTPublisher(object):
+    """
+    Publishes display events with an `iot-data` client, created on first use.
+    """
+
+    def __init__(self):
+        self.client = None
+
+    def publish(self, topic, event):
+        if self.client is None:
+            import boto3
+            self.client = boto3.client('iot-data')
+        self.client.publish(topic=topic, qos=1, payload=json.dumps(event))
+
+
+class StubPublisher(object):
+    """
+    Keeps what would have been published, for trying the handlers locally.
+    """
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, event):
+        self.published.append((topic, event))
+
+
+class RecordedTransportAPI(object):
+    """
+    Answers every station with a saved `live.json` response.
+    """
+
+    def __init__(self, path):
+        with open(path) as f:
+            self.text = f.read()
+
+    def load_departures_text(self, departure_station_code, calling_at=None):
+        return self.text
+
+
+iot_publisher = IoTPublisher()
+
+
+def render_frame(key, display_event, frame_seq=None):
+    """
+    The frame event for `display_event`: a delta if the display has the frame before it (`frame_seq`
+    from its data request), otherwise a key frame. `display_event` itself if it can't be rendered.
+    The frame is rendered again when `display_event` changes or the first train on it leaves.
+    """
+    try:
+        from joedisplay.render import FrameRenderer
+        from transport.stages import TrainDepartureBoardStage
+    except ImportError as e:
+        logger.warning("Can't render frames, sending departures: %s", e)
+        return display_event
+
+    if display_event['stage'] != TrainDepartureBoardStage.NAME:
+        # Errors are left for the display to show
+        return display_event
+    renderer, last_event, frames, expires = rendered.get(key, (None, None, None, 0))
+    if renderer is None:
+        renderer = FrameRenderer(TrainDepartureBoardStage)
+    if frames is None or display_event != last_event or time.monotonic() >= expires:
+        try:
+            frame = renderer.render(display_event)
+        except ValueError as e:
+            # e.g. scrolling calling points
+            logger.info("Sending departures for %s: %s", key[0], e)
+            rendered[key] = (renderer, None, None, 0)
+            return display_event
+        if frame is not None or frames is None:
+            frames = (frame, renderer.keyframe())
+        valid_for = TrainDepartureBoardStage.next_change(display_event, datetime.now())
+        if valid_for is None:
+            valid_for = display_event['data'].get('valid_for') or 60
+        expires = time.monotonic() + valid_for
+        for frame in frames:
+            if frame is not None:
+                frame['valid_for'] = valid_for
+        rendered[key] = (renderer, display_event, frames, expires)
+
+    frame, keyframe = frames
+    if frame is not None and frame['encoding'] == 'delta' and frame['base'] == frame_seq:
+        return frame
+    return keyframe
+
+
+def data_requests(event):
+    """
+    The data requests in a Lambda `event`: one request, a list of them, `{"requests": [...]}`,
+    or an SQS batch of `Records` with a request in each `body`.
+    """
+    if isinstance(event, list):
+        return event
+    if 'Records' in event:
+        return [json.loads(record['body']) for record in event['Records']]
+    if 'requests' in event:
+        return event['requests']
+    return [event]
+
+
+def load_departures_batch_handler(event, context, publisher=None):
+    publisher = publisher or iot_publisher
+    requests = data_requests(event)
+
+    # (calling_at, platform) -> station code -> requests for it
+    groups = OrderedDict()
+    for request in requests:
+        data = request.get('data') or {}
+        stations = groups.setdefault((data.get('calling_at'), data.get('platform')), OrderedDict())
+        stations.setdefault(data.get('station_code'), []).append(request)
+
+    api = get_api()
+    published = 0
+    for (calling_at, platform), stations in groups.items():
+        for station_code, display_event in api.load_departures_for_stations(
+                stations, calling_at, platform, top=TOP):
+            for request in stations[station_code]:
+                payload = display_event
+                if (request.get('data') or {}).get('render'):
+                    payload = render_frame((station_code, calling_at, platform), display_event,
+                                           request.get('frame_seq'))
+                publisher.publish(f"display/{request['client_id']}/input", payload)
+                published += 1
+
+    return {
+        'requests': len(requests),
+        'stations': sum(len(stations) for stations in groups.values()),
+        'published': published
+    }
 
 
 def load_departures_for_station_handler(event, context):
-    data = event['data']
-    display_event = api.load_departures_for_station(
-        data['station_code'], top=4)
-    topic = f"display/{event['client_id']}/input"
-    response = client.publish(
-        topic=topic,
-        qos=1,
-        payload=json.dumps(display_event)
-    )
+    return load_departures_batch_handler(event, context)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from transport_api import TrainDisplayBoardDecorator
+
+    _api = TrainDisplayBoardDecorator(RecordedTransportAPI(sys.argv[1]))
+    stub = StubPublisher()
+    batch = {'Records': [{'body': json.dumps({'client_id': f"rpi-{i}", 'data': {'station_code': code}})}
+                         for i, code in enumerate(['NCL', 'NCL', 'EDB', 'NCL', 'YRK', 'EDB'])]}
+
+    start = time.perf_counter()
+    result = load_departures_batch_handler(batch, None, publisher=stub)
+    elapsed = time.perf_counter() - start
+
+    for topic, event in stub.published:
+        print(topic, json.dumps(event)[:100])
+    print(f"{result} in {elapsed * 1000:.1f}ms")
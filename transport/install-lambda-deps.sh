@@ -1,4 +1,6 @@
 #!/bin/sh
 rm -rf vendor
 mkdir vendor
-pip install --target ./vendor requests
+# luma.core, numpy and Pillow are only for rendering frames.
+# numpy and Pillow are compiled, so install them on Linux x86_64 to match Lambda.
+pip install --target ./vendor requests luma.core==1.12.0 numpy Pillow
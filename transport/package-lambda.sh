@@ -1,8 +1,14 @@
 #!/bin/sh
+# Run in transport/ after install-lambda-deps.sh. The handlers import their neighbours flat
+# (transport_api), and rendering frames needs the joedisplay and transport packages as well.
 rm -f event-producer-lambda.zip
 cd vendor
 zip -r9 ${OLDPWD}/event-producer-lambda.zip .
 cd $OLDPWD
-zip -g deployment.zip *.py
+zip -g event-producer-lambda.zip *.py
+cd ..
+zip -gr9 transport/event-producer-lambda.zip joedisplay transport \
+    -x '*__pycache__*' 'transport/vendor/*' 'transport/*.zip' 'transport/*.sh'
+cd transport
 echo
-echo '... ok now please upload deployment.zip to Lambda... you probably could afford a better deployment pipeline?! 🤠'
+echo '... ok now please upload event-producer-lambda.zip to Lambda... you probably could afford a better deployment pipeline?! 🤠'
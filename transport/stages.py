@@ -1,8 +1,8 @@
-from threading import Thread
 from luma.core.virtual import terminal
 from luma.core.render import canvas
 from luma.core.virtual import viewport
 import time
+from datetime import timedelta
 import logging
 import sys
 import json
@@ -10,13 +10,14 @@ from threading import Timer
 
 from joedisplay import Stage
 
-from transport.train_renderer import TrainDepartureBoard
+from transport.train_renderer import TrainDepartureBoard, FONTS, departure_datetime
 
 logger = logging.getLogger(__name__)
 
 
 class TrainDepartureBoardStage(Stage):
     NAME = 'train-display-board'
+    FONTS = FONTS
 
     """
     UK train times display stage implementation. Example payload in examples/train-display-board.json
@@ -29,36 +30,98 @@ class TrainDepartureBoardStage(Stage):
     00:00  Edinburgh Waverley        Plat 2    On time
                       20:00:00
 
-    The clock is refreshed every second.
-    """
-    class Runner(Thread):
-        """
-        As this stage displays a clock, we need to constantly be refreshing the display.
-        """
+    If the first departure has `calling_at` stations, the second row scrolls them instead
+    and the fourth departure is not shown:
 
-        def __init__(self, *args, **kwargs):
-            super(TrainDepartureBoardStage.Runner,
-                  self).__init__(*args, **kwargs)
-            self.aborted = False
+    00:00  Edinburgh Waverley        Plat 2    On time
+    Calling at: Morpeth, Alnmouth, Berwick-upon-Tweed and Dunbar
+    00:00  Edinburgh Waverley        Plat 2    On time
+    00:00  Edinburgh Waverley        Plat 2    On time
+                      20:00:00
 
-        def run(self):
-            while not self.aborted:
-                self.display.refresh()
-                time.sleep(0.025)
+    The clock is refreshed every second by the controller's frame scheduler, or 25 times a second
+    while the calling points scroll. With `clock=False` the board is drawn without it, for rendering
+    frames that the display adds the clock to (see `joedisplay.render`).
+    """
+    CLOCK = (TrainDepartureBoard.CLOCK_TOP, TrainDepartureBoard.CLOCK_HEIGHT)
 
-    def __init__(self, device):
-        self.display = TrainDepartureBoard(device)
-        self.runner = TrainDepartureBoardStage.Runner()
-        self.runner.display = self.display  # FIX THIS by updating the ctor
+    def __init__(self, device, clock=True):
+        self.display = TrainDepartureBoard(device, clock)
 
     def start(self):
-        self.runner.start()
+        self.display.invalidate()
+
+    def refresh(self):
+        self.display.refresh()
 
-    def stop(self):
-        self.runner.aborted = True
+    def frame_interval(self):
+        return self.display.frame_interval()
 
     def handle(self, event, context):
         try:
-            self.display.update(event['data']['departures'])
+            self.display.update(event['data']['departures'],
+                                event['data'].get('valid_for'))
         except:
             pass
+
+    @staticmethod
+    def upcoming(event, now):
+        """
+        (departure time, departure) for the departures in `event` the board still shows at `now`,
+        or `None` if `event` has no departures.
+        """
+        try:
+            departures = event['data']['departures']
+        except (KeyError, TypeError):
+            return None
+        grace = timedelta(seconds=TrainDepartureBoard.DEPARTED_GRACE)
+        return [(t, d) for t, d in ((departure_datetime(d, now), d) for d in departures)
+                if t is not None and now - t <= grace]
+
+    @classmethod
+    def next_refresh(cls, event, now):
+        """
+        Seconds until the board runs out of departures to fill its rows, as the board promotes later
+        departures itself while earlier ones leave. At most the data's `valid_for`.
+        """
+        upcoming = cls.upcoming(event, now)
+        if upcoming is None:
+            return None
+        valid_for = event['data'].get('valid_for')
+        if not upcoming:
+            return valid_for
+        times = sorted(t for t, _ in upcoming)
+        rows = 3 if upcoming[0][1].get('calling_at') else 4
+        # The board is short of a row once this one has left, or the first if it is already short
+        last = times[len(times) - rows] if len(times) > rows else times[0]
+        return cls._until(last, now, valid_for)
+
+    @classmethod
+    def next_change(cls, event, now):
+        """
+        Seconds until the first departure on the board leaves, when a picture of the board goes out of
+        date. At most the data's `valid_for`.
+        """
+        upcoming = cls.upcoming(event, now)
+        if upcoming is None:
+            return None
+        valid_for = event['data'].get('valid_for')
+        if not upcoming:
+            return valid_for
+        return cls._until(min(t for t, _ in upcoming), now, valid_for)
+
+    @staticmethod
+    def _until(when, now, valid_for):
+        seconds = (when - now).total_seconds() + TrainDepartureBoard.DEPARTED_GRACE
+        return seconds if valid_for is None else min(seconds, valid_for)
+
+    @staticmethod
+    def content(event):
+        # Not the request time, which changes with every response
+        return (event.get('data') or {}).get('departures')
+
+    def patch(self, patch, context):
+        try:
+            self.display.patch(patch['departures'], patch.get('valid_for'))
+        except:
+            logger.exception("Could not apply patch")
@@ -4,8 +4,13 @@ import time
 from PIL import ImageFont
 from luma.core.render import canvas
 from luma.core.virtual import viewport, snapshot, hotspot
-from datetime import datetime
+from datetime import datetime, timedelta
+from joedisplay.clock import ClockRenderer, CLOCK_FONT_LARGE, CLOCK_FONT_TALL
 from joedisplay.helpers import make_font
+from joedisplay.measure import measure, fit_text
+from joedisplay.scroller import StripScroller
+from joedisplay.sprites import sprites
+from joedisplay.virtual import DamageTrackingViewport
 
 """
 Renderers for UK train times.
@@ -14,15 +19,42 @@ Heavily influenced by:
 - https://github.com/balena-io-playground/UK-Train-Departure-Display
 - https://github.com/chrishutchinson/train-departure-screen
 
-Caveats:
-- Doesn't yet support the scrolling 'Calling at: ' functionality of the above.
-- Probably should think about truncating longer station names
+Departures are dropped once they have left (by their expected time if delayed) and the following
+ones move up, so the board stays correct between fetches. Send more departures than there are rows
+to give it something to promote.
+
+When the first departure has calling points, a scrolling 'Calling at: ' line is shown beneath it
+in place of the fourth departure.
 """
 
-font = make_font("Dot Matrix Regular.ttf", 10)
-font_bold = make_font("Dot Matrix Bold.ttf", 10)
-font_bold_tall = make_font("Dot Matrix Bold Tall.ttf", 10)
-font_bold_large = make_font("Dot Matrix Bold.ttf", 20)
+FONT = ("Dot Matrix Regular.ttf", 10)
+FONT_BOLD = ("Dot Matrix Bold.ttf", 10)
+FONT_BOLD_TALL = CLOCK_FONT_TALL
+FONT_BOLD_LARGE = CLOCK_FONT_LARGE
+
+# Loaded lazily from the font registry when a board is created. Pass to `fonts.preload` to load early.
+FONTS = [FONT, FONT_BOLD, FONT_BOLD_TALL, FONT_BOLD_LARGE]
+
+
+def departure_datetime(departure, now):
+    """
+    When `departure` is expected to leave: its 'Exp HH:MM' status if delayed, otherwise its departure time.
+    Times are taken to be within 12 hours of `now`, so boards either side of midnight work.
+    Returns `None` if there's no usable time.
+    """
+    status = departure.get('status') or ''
+    hhmm = status[4:] if status.startswith('Exp ') else departure.get('departure_time')
+    try:
+        t = datetime.strptime(hhmm, '%H:%M').time()
+    except (TypeError, ValueError):
+        return None
+
+    when = datetime.combine(now.date(), t)
+    if when - now > timedelta(hours=12):
+        when -= timedelta(days=1)
+    elif now - when > timedelta(hours=12):
+        when += timedelta(days=1)
+    return when
 
 
 class DepartureRenderer(hotspot):
@@ -30,6 +62,7 @@ class DepartureRenderer(hotspot):
     Renders a line (i.e. a departure) on the display board.
     Contains state. Updates only if the `dirty` flag is high.
     """
+    FIELDS = ('departure_time', 'destination', 'platform', 'status')
 
     def __init__(self, width, height, title_font, font):
         super(DepartureRenderer, self).__init__(width, height)
@@ -37,6 +70,12 @@ class DepartureRenderer(hotspot):
         self.height = height
         self.title_font = title_font
         self.font = font
+        # Column positions only depend on the fonts
+        self.status_width = measure("Exp 00:00", font)[0]
+        self.platform_width = measure("Plat 88", font)[0]
+        self.time_width = measure("00:00", title_font)[0]
+        self.destination_width = width - self.platform_width - \
+            self.status_width - self.time_width - 8
         # State
         self.departure_time = None
         self.destination = None
@@ -54,6 +93,18 @@ class DepartureRenderer(hotspot):
         self.platform = ""
         self.status = ""
 
+    def set_departure(self, departure):
+        """
+        Show `departure` (or nothing if `None`). Only marks the row dirty if something it shows changed.
+        """
+        departure = departure or {}
+        values = tuple(departure.get(k) or "" for k in self.FIELDS)
+        if values == tuple(getattr(self, k) for k in self.FIELDS):
+            return False
+        self.departure_time, self.destination, self.platform, self.status = values
+        self.set_dirty(True)
+        return True
+
     def should_redraw(self):
         # Don't show if not yet initialised
         if self.departure_time is None or self.destination is None or self.platform is None or self.status is None:
@@ -64,30 +115,128 @@ class DepartureRenderer(hotspot):
         return False
 
     def update(self, draw):
-        # Get max widths - shouldn't actually need to measure every time?
-        w, h = draw.textsize("Exp 00:00", self.font)
-        sw, sh = draw.textsize(self.status, self.font)
-        pw, ph = draw.textsize("Plat 88", self.font)
-        tw, th = draw.textsize("00:00", self.title_font)
+        sw, sh = measure(self.status, self.font)
+        destination = fit_text(
+            self.destination, self.title_font, self.destination_width)
+
+        sprites.draw(draw, (0, 0), self.departure_time, self.title_font)
+        sprites.draw(draw, (self.time_width + 4, 0),
+                     destination, self.title_font)
+        sprites.draw(draw, (self.width - self.platform_width - self.status_width, 0),
+                     self.platform, self.font)
+        sprites.draw(draw, (self.width - sw, 0), self.status, self.font)
 
-        draw.text((0, 0), self.departure_time, font=self.title_font)
-        draw.text((tw + 4, 0), self.destination, font=self.title_font)
-        draw.text((self.width - pw - w, 0), self.platform, font=self.font)
-        draw.text((self.width - sw, 0), self.status, font=self.font)
+
+class CallingAtRenderer(hotspot):
+    """
+    Renders the 'Calling at: ' line. The calling points are rasterized into a looping strip once per
+    departures update and each frame is a crop of it, so scrolling doesn't redraw anything else.
+    """
+    LABEL = "Calling at: "
+    SPEED = 25
+    GAP = 48
+
+    def __init__(self, width, height, font):
+        super(CallingAtRenderer, self).__init__(width, height)
+        self.font = font
+        self.label_width = measure(self.LABEL, font)[0]
+        self.window_width = width - self.label_width
+        self.calling_at = None
+        self.scroller = None
+        self.shown_offset = None
+
+    def set_calling_at(self, calling_at):
+        if calling_at == self.calling_at:
+            return
+        self.calling_at = calling_at
+        self.shown_offset = None
+        if not calling_at:
+            self.scroller = None
+            return
+
+        text = calling_at[0] if len(calling_at) == 1 else \
+            "{} and {}".format(", ".join(calling_at[:-1]), calling_at[-1])
+        # Only scroll if it doesn't fit
+        fits = measure(text, self.font)[0] <= self.window_width
+        self.scroller = StripScroller.for_text(
+            text, self.font, self.window_width, self.height, lead_in=False,
+            gap=0 if fits else self.GAP, loop=True, speed=0 if fits else self.SPEED)
+
+    @property
+    def scrolling(self):
+        return self.scroller is not None and self.scroller.speed > 0
+
+    def should_redraw(self):
+        if self.scroller is None:
+            return False
+        return self.scroller.offset() != self.shown_offset
+
+    def damage(self):
+        if self.shown_offset is None:
+            return None
+        return [(self.label_width, 0, self.width, self.height)]
+
+    def paste_into(self, image, xy):
+        x, y = xy
+        offset = self.scroller.offset()
+        if self.shown_offset is None:
+            image.paste("black", (x, y, x + self.width, y + self.height))
+            label = sprites.get(self.LABEL, self.font)
+            image.paste("white", (x, y, x + label.width, y + label.height), label)
+        image.paste(self.scroller.frame(), (x + self.label_width, y))
+        self.shown_offset = offset
+
+
+class StaleRenderer(hotspot):
+    """
+    Shows `TEXT` while the board's data is older than it is valid for, and nothing otherwise.
+    """
+    TEXT = "Out of date"
+
+    def __init__(self, width, height, font):
+        super(StaleRenderer, self).__init__(width, height)
+        self.font = font
+        self.stale = False
+        self.shown = None
+
+    def should_redraw(self):
+        return self.stale != self.shown
+
+    def paste_into(self, image, xy):
+        x, y = xy
+        image.paste("black", (x, y, x + self.width, y + self.height))
+        if self.stale:
+            text = sprites.get(self.TEXT, self.font)
+            top = y + self.height - text.height
+            image.paste("white", (x, top, x + text.width, top + text.height), text)
+        self.shown = self.stale
 
 
 class TrainDepartureBoard(object):
     """
-    Helper class that renders 4 departures and a clock.
+    Helper class that renders 4 departures and a clock, or 3 departures and the calling points of the
+    first one if the payload has them (`calling_at`: a list of station names).
+    "Out of date" is shown beside the clock once the data is older than its `valid_for`.
+    With `clock=False` the clock row (`CLOCK_TOP` and `CLOCK_HEIGHT`) is left empty, for whatever
+    shows the board to draw a clock there itself.
     """
+    TICKER_INTERVAL = 0.04
+    # Seconds a train stays on the board after it was due to leave
+    DEPARTED_GRACE = 30
+    EXPIRY_CHECK_INTERVAL = 5
+    CLOCK_TOP = 50
+    CLOCK_HEIGHT = 14
 
-    def __init__(self, device):
+    def __init__(self, device, clock=True):
         self.DEPARTURE_TOP_MARGIN = 2
         self.DEPARTURE_HEIGHT = 10
 
-        self.viewport = viewport(
+        self.viewport = DamageTrackingViewport(
             device, width=device.width, height=device.height)
 
+        font = make_font(*FONT)
+        font_bold = make_font(*FONT_BOLD)
+
         # Add departure rows. First row has larger title text.
         self.departures = [
             DepartureRenderer(
@@ -96,42 +245,147 @@ class TrainDepartureBoard(object):
             DepartureRenderer(device.width, self.DEPARTURE_HEIGHT, font, font),
             DepartureRenderer(device.width, self.DEPARTURE_HEIGHT, font, font)
         ]
+        self.ticker = CallingAtRenderer(
+            device.width, self.DEPARTURE_HEIGHT, font)
+        self.show_calling_at = None
+        self.rows = []
+        self.departure_data = []
+        self.received = None
+        self.valid_for = None
+        self.next_expiry_check = 0
+
+        self.clock = None
+        self.stale_marker = None
+        if clock:
+            self.clock = ClockRenderer(device.width, self.CLOCK_HEIGHT, make_font(
+                *FONT_BOLD_LARGE), make_font(*FONT_BOLD_TALL))
+            self.viewport.add_hotspot(self.clock, (0, self.CLOCK_TOP))
+            # After the clock, so it is drawn over the clock's background
+            self.stale_marker = StaleRenderer(
+                sprites.get(StaleRenderer.TEXT, font).width, self.CLOCK_HEIGHT, font)
+            self.viewport.add_hotspot(self.stale_marker, (0, self.CLOCK_TOP))
+
+        self.layout(False)
+
+    def layout(self, show_calling_at):
+        """
+        Place the rows, either 4 departures or a departure, the calling points and 2 more departures.
+        """
+        if show_calling_at == self.show_calling_at:
+            return
+        self.show_calling_at = show_calling_at
+
+        for row in self.rows:
+            self.viewport.remove_hotspot(*row)
+        rows = self.departures
+        if show_calling_at:
+            rows = [self.departures[0], self.ticker] + self.departures[1:3]
+
+        self.rows = []
         h = 0
-        for d in self.departures:
-            self.viewport.add_hotspot(d, (0, h))
-            h = h + d.height + self.DEPARTURE_TOP_MARGIN
+        for r in rows:
+            self.rows.append((r, (0, h)))
+            self.viewport.add_hotspot(r, (0, h))
+            h = h + r.height + self.DEPARTURE_TOP_MARGIN
+        self.invalidate()
 
-        # Add clock
-        self.viewport.add_hotspot(
-            snapshot(device.width, 14, self.render_clock, interval=0.1), (0, 50))
+    def update(self, departure_data, valid_for=None):
+        """
+        Show the departures in `departure_data` that haven't left yet. Only rows whose fields changed
+        are redrawn. `valid_for` is how many seconds the data can be trusted for.
+        """
+        self.departure_data = [dict(d) for d in departure_data]
+        self.received = time.monotonic()
+        if valid_for is not None:
+            self.valid_for = valid_for
+        self.show(self.upcoming())
 
-    def update(self, departure_data):
-        # Empty out current values in case this payload doesn't have the same number of departures
-        for renderer in self.departures:
-            renderer.clear()
+    def upcoming(self, now=None):
+        now = now or datetime.now()
+        grace = timedelta(seconds=self.DEPARTED_GRACE)
 
-        # Update with passed data
-        for renderer, departure in zip(self.departures, departure_data):
-            renderer.departure_time = departure.get('departure_time')
-            renderer.destination = departure.get('destination')
-            renderer.platform = departure.get('platform')
-            renderer.status = departure.get('status')
+        def departed(d):
+            when = departure_datetime(d, now)
+            return when is not None and now - when > grace
 
-        # Set dirty flag on all to trigger a refresh
-        for renderer in self.departures:
-            renderer.set_dirty(True)
+        return [d for d in self.departure_data if not departed(d)]
+
+    def show(self, departure_data):
+        # Rows past the end of the data are emptied
+        for i, renderer in enumerate(self.departures):
+            renderer.set_departure(
+                departure_data[i] if i < len(departure_data) else None)
+
+        calling_at = departure_data[0].get('calling_at') if departure_data else None
+        self.ticker.set_calling_at(calling_at)
+        self.layout(bool(calling_at))
 
-    def render_clock(self, draw, width, height):
-        raw_time = datetime.now().time()
-        hour, minute, second = str(raw_time).split('.')[0].split(':')
+    def expire(self):
+        """
+        Drop departures that have left and promote the ones after them. Called from `refresh`.
+        """
+        now = time.monotonic()
+        if now < self.next_expiry_check:
+            return
+        self.next_expiry_check = now + self.EXPIRY_CHECK_INTERVAL
+        self.show(self.upcoming())
 
-        w1, h1 = draw.textsize("{}:{}".format(hour, minute), font_bold_large)
-        w2, h2 = draw.textsize(":00", font_bold_tall)
+    @property
+    def stale(self):
+        """
+        Whether the data is older than its `valid_for`.
+        """
+        if self.received is None or self.valid_for is None:
+            return False
+        return time.monotonic() - self.received > self.valid_for
+
+    def patch(self, departures, valid_for=None):
+        """
+        Apply changes to some departures. `departures` maps the index of a departure in the last payload
+        (as a string, as it arrives in JSON) to the fields that changed, e.g. `{"1": {"status": "Exp 14:27"}}`.
+        Like `update`, this restarts the `valid_for` timer, even if `departures` is empty.
+        """
+        data = [dict(d) for d in self.departure_data]
+        for index, fields in departures.items():
+            i = int(index)
+            if i < len(data):
+                data[i].update(fields)
+            elif i == len(data):
+                data.append(dict(fields))
+        self.update(data, valid_for)
 
-        draw.text(((width - w1 - w2) / 2, 0), text="{}:{}".format(hour, minute),
-                  font=font_bold_large)
-        draw.text((((width - w1 - w2) / 2) + w1, 5), text=":{}".format(second),
-                  font=font_bold_tall)
+    def invalidate(self):
+        """
+        Repaint everything on the next refresh, e.g. when resuming after another stage used the device.
+        """
+        for renderer in self.departures:
+            renderer.set_dirty(True)
+        if self.clock is not None:
+            self.clock.shown = None
+            self.stale_marker.shown = None
+        self.ticker.shown_offset = None
+        self.viewport.invalidate()
 
     def refresh(self):
+        """
+        Pushes only the damaged regions to the device. Throughput is available from `stats`.
+        """
+        self.expire()
+        if self.stale_marker is not None:
+            self.stale_marker.stale = self.stale
         self.viewport.refresh()
+
+    def frame_interval(self):
+        """
+        Only the seconds of the clock change between updates, unless the calling points are scrolling.
+        Without the clock, nothing changes until the next update.
+        """
+        if self.show_calling_at and self.ticker.scrolling:
+            return self.TICKER_INTERVAL
+        if self.clock is None:
+            return None
+        return 1.0
+
+    @property
+    def stats(self):
+        return self.viewport.stats
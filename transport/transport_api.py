@@ -1,6 +1,15 @@
 import os
-import requests
+import re
+import copy
+import time
 import json
+from itertools import islice
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from threading import Lock, Thread
+
+import requests
+import requests.adapters
 
 """
 Components that make calls to the Transport API and format them into a form understood by 
@@ -11,67 +20,416 @@ https://developer.transportapi.com/
 """
 
 
+# The fields of a departure that the board uses. Everything else in the response is skipped.
+DEPARTURE_FIELDS = ('aimed_departure_time', 'expected_departure_time', 'destination_name', 'platform',
+                    'status', 'operator', 'train_uid', 'station_detail')
+HEADER_FIELDS = ('request_time', 'station_code', 'station_name')
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'\s*')
+_tokens = re.compile(r'"(?:[^"\\]|\\.)*"|[\[\]{}]')
+
+
+class JSONCursor(object):
+    """
+    Walks a JSON document without decoding it all. `members()` and `elements()` yield at each value of
+    an object or array. The caller either decodes it with `value()` or leaves it, in which case it is
+    skipped by scanning for the end of it rather than decoding it.
+    """
+
+    def __init__(self, text, i=0):
+        self.text = text
+        self.i = i
+
+    def peek(self):
+        self.i = _whitespace.match(self.text, self.i).end()
+        return self.text[self.i:self.i + 1]
+
+    def expect(self, c):
+        if self.peek() != c:
+            raise ValueError(f"Expected {c!r} at {self.i}")
+        self.i += 1
+
+    def value(self):
+        self.peek()
+        value, self.i = _decoder.raw_decode(self.text, self.i)
+        return value
+
+    def skip(self):
+        if self.peek() not in ('[', '{'):
+            self.value()
+            return
+        depth = 0
+        for m in _tokens.finditer(self.text, self.i):
+            token = m.group()
+            if token == '[' or token == '{':
+                depth += 1
+            elif token == ']' or token == '}':
+                depth -= 1
+                if depth == 0:
+                    self.i = m.end()
+                    return
+        raise ValueError("Unterminated JSON value")
+
+    def _items(self, opening, closing, keyed):
+        self.expect(opening)
+        if self.peek() == closing:
+            self.i += 1
+            return
+        while True:
+            if keyed:
+                key = self.value()
+                self.expect(':')
+            self.peek()
+            start = self.i
+            yield key if keyed else None
+            if self.i == start:
+                self.skip()
+            if self.peek() == closing:
+                self.i += 1
+                return
+            self.expect(',')
+
+    def members(self):
+        return self._items('{', '}', True)
+
+    def elements(self):
+        return self._items('[', ']', False)
+
+
+def _board_fields(departure):
+    """
+    Only the fields of `departure` that the board uses, and only the names of its calling points.
+    """
+    fields = {k: departure[k] for k in DEPARTURE_FIELDS if k in departure}
+    detail = fields.get('station_detail')
+    if isinstance(detail, dict):
+        fields['station_detail'] = {'calling_at': [{'station_name': s.get('station_name')}
+                                                   for s in detail.get('calling_at') or []]}
+    return fields
+
+
+def _departures(cursor):
+    for key in cursor.members():
+        if key != 'all':
+            continue
+        for _ in cursor.elements():
+            # One departure at a time: decoding a whole object in C is much faster than walking its fields
+            yield _board_fields(cursor.value())
+        return
+
+
+def decode_live_departures(text):
+    """
+    Decode a `live.json` response lazily. Returns a dict of the `HEADER_FIELDS` with `departures.all`
+    as a generator that decodes one departure at a time and keeps only its `DEPARTURE_FIELDS` (and only
+    the station names of the calling points). Departures after the ones asked for are never decoded.
+    """
+    cursor = JSONCursor(text)
+    data = {}
+    departures_at = None
+    for key in cursor.members():
+        if key in HEADER_FIELDS:
+            data[key] = cursor.value()
+        elif key == 'departures':
+            departures_at = cursor.i
+            if all(f in data for f in HEADER_FIELDS):
+                # Everything else is in the departures, so stop reading here
+                break
+    if departures_at is None:
+        raise ValueError("No departures in response")
+    data['departures'] = {'all': _departures(JSONCursor(text, departures_at))}
+    return data
+
+
+class CachedResponse(object):
+    """
+    A response body kept by `TransportAPI`, with what it takes to revalidate it.
+    """
+
+    def __init__(self, text, fetched, expires, etag=None, last_modified=None):
+        self.text = text
+        self.fetched = fetched
+        self.expires = expires
+        self.etag = etag
+        self.last_modified = last_modified
+
+
 class TransportAPI(object):
     """
     Client to interact with the UK Transport API.
+
+    Requests go through one keep-alive `requests.Session` (which also asks for gzip) and responses are
+    cached per (station, calling_at) for as long as the response's `Cache-Control: max-age` allows, or
+    `ttl` seconds if it doesn't say. For `stale_for` seconds after that, the cached response is still
+    returned straight away while it is revalidated in the background, or synchronously if `background`
+    is false (e.g. in Lambda, which freezes threads between invocations). Within the same window, a
+    cached response is also returned if the upstream fails or doesn't answer within `timeout` seconds.
+    Revalidation is a conditional request, so an unchanged response costs a 304. At most `cache_size`
+    stations are cached, the least recently used being dropped first.
+
+    `stats` counts `hits` (fresh), `stale` (served while revalidating), `misses` (waited for the upstream),
+    `upstream` requests and their total `upstream_time`, `not_modified` responses, `errors` and
+    `evicted` responses.
     """
     class BadRequestException(Exception):
         def __init__(self, message):
             self.message = message
 
-    def __init__(self, app_id, app_key):
+    URL = "https://transportapi.com/v3/uk/train/station/{}/live.json"
+
+    def __init__(self, app_id, app_key, ttl=60, stale_for=300, timeout=5, background=True,
+                 pool_size=10, cache_size=256, clock=time.monotonic):
         """
         Constructor requires app ID and app key from https://developer.transportapi.com/
         """
         self.app_id = app_id
         self.app_key = app_key
+        self.ttl = ttl
+        self.stale_for = stale_for
+        self.timeout = timeout
+        self.background = background
+        self.cache_size = cache_size
+        self.clock = clock
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+
+        self.cache = OrderedDict()
+        self.revalidating = set()
+        self.lock = Lock()
+        self.stats = dict.fromkeys(
+            ('hits', 'stale', 'misses', 'upstream', 'upstream_time', 'not_modified', 'errors', 'evicted'), 0)
 
     def load_departures_for_station(self, departure_station_code, calling_at=None):
         """
         Get live departures from `departure_station_code` - a CRS code.
         Optionally only include departures that are calling at `calling_at` - also a CRS code.
+        Each departure includes its calling points in `station_detail`.
         See the API documentation for more information and also this list of stations here:
         http://www.railwaycodes.org.uk/crs/CRS0.shtm
         """
-        url = f"https://transportapi.com/v3/uk/train/station/{departure_station_code}/live.json"
+        return json.loads(self.load_departures_text(departure_station_code, calling_at))
+
+    def load_departures_text(self, departure_station_code, calling_at=None):
+        """
+        As `load_departures_for_station`, but the JSON text of the response, as cached.
+        """
+        key = (departure_station_code, calling_at)
+        now = self.clock()
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+            if cached is not None and now < cached.expires:
+                self.stats['hits'] += 1
+                return cached.text
+            stale = cached is not None and now < cached.expires + self.stale_for and self.background
+            revalidate = stale and key not in self.revalidating
+            if stale:
+                self.stats['stale'] += 1
+                self.revalidating.add(key)
+            else:
+                self.stats['misses'] += 1
+
+        if stale:
+            if revalidate:
+                Thread(target=self._revalidate, args=(key, cached), daemon=True).start()
+            return cached.text
+        return self._fetch(key, cached).text
+
+    def _revalidate(self, key, cached):
+        try:
+            self._fetch(key, cached)
+        except TransportAPI.BadRequestException:
+            pass
+        finally:
+            with self.lock:
+                self.revalidating.discard(key)
 
+    def _fetch(self, key, cached):
+        """
+        Request `key` from the upstream, conditionally if there is a cached response, and cache the result.
+        Falls back to the cached response if the upstream fails.
+        """
+        departure_station_code, calling_at = key
         params = {
             'app_id': self.app_id,
-            'app_key': self.app_key
+            'app_key': self.app_key,
+            'station_detail': 'calling_at'
         }
 
         if calling_at:
             params['calling_at'] = calling_at
 
-        r = requests.get(url=url, params=params)
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+
+        started = self.clock()
+        try:
+            r = self.session.get(url=self.URL.format(departure_station_code), params=params,
+                                 headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            r = None
+            error = f"Could not reach the Transport API: {e.__class__.__name__}"
+        now = self.clock()
+        with self.lock:
+            self.stats['upstream'] += 1
+            self.stats['upstream_time'] += now - started
+
+        if r is not None and r.status_code == 304 and cached is not None:
+            response = CachedResponse(cached.text, now, now + self.max_age(r), cached.etag,
+                                      cached.last_modified)
+            with self.lock:
+                self.stats['not_modified'] += 1
+                self._store(key, response)
+            return response
+
+        if r is not None and r.status_code == 200:
+            response = CachedResponse(r.text, now, now + self.max_age(r), r.headers.get('ETag'),
+                                      r.headers.get('Last-Modified'))
+            with self.lock:
+                self._store(key, response)
+            return response
+
+        if r is not None:
+            try:
+                error = r.json().get("error")
+            except ValueError:
+                error = f"Transport API responded {r.status_code}"
+        with self.lock:
+            self.stats['errors'] += 1
+        if (cached is not None and (r is None or r.status_code >= 500)
+                and now < cached.expires + self.stale_for):
+            return cached
+        raise TransportAPI.BadRequestException(error)
+
+    def _store(self, key, response):
+        # Holding `lock`
+        self.cache[key] = response
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+            self.stats['evicted'] += 1
+
+    def age(self, departure_station_code, calling_at=None):
+        """
+        Seconds since the cached response for the station was fetched or last revalidated, or 0.
+        """
+        with self.lock:
+            cached = self.cache.get((departure_station_code, calling_at))
+        return 0 if cached is None else self.clock() - cached.fetched
+
+    def max_age(self, response):
+        """
+        Seconds `response` may be cached for, from its `Cache-Control` header, or `ttl`.
+        """
+        for directive in response.headers.get('Cache-Control', '').split(','):
+            name, _, value = directive.strip().partition('=')
+            if name == 'no-cache' or name == 'no-store':
+                return 0
+            if name == 'max-age' and value.isdigit():
+                return int(value)
+        return self.ttl
 
-        if r.status_code != 200:
-            raise TransportAPI.BadRequestException(r.json().get("error"))
-        else:
-            return r.json()
+    def cache_stats(self):
+        """
+        `stats`, plus the share of requests answered without waiting for the upstream and the mean latency.
+        """
+        with self.lock:
+            stats = dict(self.stats)
+        answered = stats['hits'] + stats['stale'] + stats['misses']
+        stats['saved'] = (stats['hits'] + stats['stale']) / answered if answered else 0
+        stats['mean_upstream_time'] = stats['upstream_time'] / stats['upstream'] if stats['upstream'] else 0
+        return stats
 
 
 class TrainDisplayBoardDecorator(object):
     """
     Decorator for above API client to transform the responses into JSON understood by the train-display-board
     display stage.
+
+    Concurrent calls for the same (station, calling_at, platform, top) share one in-flight request.
+    `load_departures_for_stations` fetches many stations at once on up to `max_workers` threads.
     """
+    # Seconds the board can rely on a payload for. It drops departed trains itself in the meantime.
+    VALID_FOR = 300
 
-    def __init__(self, api):
+    def __init__(self, api, max_workers=4):
         self.api = api
+        self.max_workers = max_workers
+        self.in_flight = {}
+        self.lock = Lock()
+        self.stats = {'requests': 0, 'collapsed': 0}
 
     def load_departures_for_station(self, departure_station_code, calling_at=None, platform=None, top=100):
+        key = (departure_station_code, calling_at, platform, top)
+        with self.lock:
+            self.stats['requests'] += 1
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self.in_flight[key] = Future()
+            else:
+                self.stats['collapsed'] += 1
+
+        if not leader:
+            # Each waiter gets its own copy to modify
+            return copy.deepcopy(future.result())
+
+        try:
+            payload = self._load_departures_for_station(*key)
+            future.set_result(payload)
+            return payload
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def load_departures_for_stations(self, departure_station_codes, calling_at=None, platform=None, top=100,
+                                     max_workers=None):
+        """
+        Load departures for each of `departure_station_codes` concurrently, on up to `max_workers` threads.
+        Yields (station code, payload) tuples as they complete, not in the order given.
+        """
+        codes = list(OrderedDict.fromkeys(departure_station_codes))
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as executor:
+            futures = {executor.submit(self.load_departures_for_station, code, calling_at, platform, top): code
+                       for code in codes}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def _load_departures_for_station(self, departure_station_code, calling_at, platform, top):
         try:
             if departure_station_code is None:
                 raise TransportAPI.BadRequestException(
                     "No departure station code set.")
-            data = self.api.load_departures_for_station(
-                departure_station_code, calling_at)
-            return self.display_payload(data, platform, top)
+            if hasattr(self.api, 'load_departures_text'):
+                data = decode_live_departures(self.api.load_departures_text(
+                    departure_station_code, calling_at))
+            else:
+                data = self.api.load_departures_for_station(
+                    departure_station_code, calling_at)
+            age = self.api.age(departure_station_code, calling_at) if hasattr(self.api, 'age') else 0
+            return self.display_payload(data, platform, top, age)
         except TransportAPI.BadRequestException as e:
             return self.error_payload(e.message)
+        except ValueError as e:
+            # A response without departures, or not JSON at all
+            return self.error_payload(f"Unexpected response from the Transport API: {e}")
 
-    def display_payload(self, data, platform, top):
+    def display_payload(self, data, platform, top, age=0):
+        """
+        Board payload for a `live.json` response, decoded or from `decode_live_departures`.
+        `age` is how many seconds old the response is, which comes off `valid_for`.
+        """
         def status_text(d):
             if d.get('status') == 'CANCELLED':
                 return 'Cancelled'
@@ -87,6 +445,10 @@ class TrainDisplayBoardDecorator(object):
                 return 'Plat ' + plat
             return ''
 
+        def calling_at_names(d):
+            calling_at = (d.get('station_detail') or {}).get('calling_at') or []
+            return [s.get('station_name') for s in calling_at if s.get('station_name')]
+
         def xform(d):
             return {
                 'departure_time': d.get('aimed_departure_time'),
@@ -94,18 +456,19 @@ class TrainDisplayBoardDecorator(object):
                 'platform': platform_text(d),
                 'status': status_text(d),
                 'operator': d.get('operator'),
-                'train_uid': d.get('train_uid')
+                'train_uid': d.get('train_uid'),
+                'calling_at': calling_at_names(d)
             }
 
         departures = data['departures']['all']
 
         # The API does not support filtering by platform, so do it here.
         if platform:
-            departures = list(filter(lambda d: d.get(
-                'platform') == str(platform), departures))
+            departures = filter(lambda d: d.get(
+                'platform') == str(platform), departures)
 
-        # xform and topN the departure list from the API
-        transformed_departures = list(map(xform, departures[0:top]))
+        # xform and topN the departure list from the API. Lazily, so a streamed response stops decoding here.
+        transformed_departures = list(map(xform, islice(departures, top)))
 
         return {
             'stage': 'train-display-board',
@@ -113,22 +476,117 @@ class TrainDisplayBoardDecorator(object):
                 'request_time': data.get('request_time'),
                 'station_code': data.get('station_code'),
                 'station_name': data.get('station_name'),
+                'valid_for': max(0, int(self.VALID_FOR - age)),
                 'departures': transformed_departures
             }
         }
 
+    def patch_payload(self, previous, current):
+        """
+        A `patch` event with only the departure rows of `current` that differ from `previous`, both
+        display payloads from `display_payload`. Returns `current` if a patch can't describe the change
+        (e.g. fewer departures). If nothing changed the patch has no rows, but still carries `valid_for`
+        so the board knows its data is fresh.
+        """
+        if previous is None or previous.get('stage') != current.get('stage') or 'data' not in current:
+            return current
+        old = previous['data']['departures']
+        new = current['data']['departures']
+        if len(new) < len(old):
+            return current
+
+        changes = {}
+        for i, departure in enumerate(new):
+            before = old[i] if i < len(old) else {}
+            fields = {k: v for k, v in departure.items() if before.get(k) != v}
+            if fields:
+                changes[str(i)] = fields
+        return {
+            'stage': current['stage'],
+            'patch': {'departures': changes, 'valid_for': current['data'].get('valid_for')}
+        }
+
     def error_payload(self, error):
         return {
             'stage': 'text',
-            'message': f"Sorry! An error occurred:\n{error}"
+            'message': f"Sorry! An error occurred:\n{error}",
+            'animate': False
         }
 
 
+def _sample_response(departures=400, calling_points=20):
+    """
+    A `live.json` response shaped like a large station's, for benchmarking without credentials.
+    """
+    stations = [{'station_code': f"S{i:02}", 'tiploc_code': f"STN{i:02}", 'station_name': f"Station {i}",
+                 'platform': str(i % 8), 'aimed_arrival_time': '10:00', 'aimed_departure_time': '10:01',
+                 'expected_arrival_time': '10:00', 'expected_departure_time': '10:01'}
+                for i in range(calling_points)]
+    return json.dumps({
+        'date': '2019-12-11', 'time_of_day': '10:00', 'request_time': '2019-12-11T10:00:00+00:00',
+        'station_name': 'Newcastle', 'station_code': 'NCL',
+        'departures': {'all': [{
+            'mode': 'train', 'service': '24745000', 'train_uid': f"C{i:05}", 'platform': str(i % 12),
+            'operator': 'GR', 'operator_name': 'LNER', 'aimed_departure_time': '10:05',
+            'aimed_arrival_time': '10:02', 'aimed_pass_time': None, 'origin_name': 'London Kings Cross',
+            'destination_name': 'Edinburgh', 'source': 'Network Rail', 'category': 'XX',
+            'service_timetable': {'id': 'https://transportapi.com/v3/uk/train/service/...'},
+            'status': 'LATE', 'expected_arrival_time': '10:04', 'expected_departure_time': '10:07',
+            'best_arrival_estimate_mins': 4, 'best_departure_estimate_mins': 7,
+            'station_detail': {'origin': stations[:1], 'destination': stations[-1:], 'calling_at': stations}
+        } for i in range(departures)]}
+    })
+
+
 if __name__ == "__main__":
     """
     Dump the 'display' JSON. Set TRANSPORTAPI_APP_ID and TRANSPORTAPI_APP_KEY with credentials from the developer portal.
+
+    With `--record STATION`, print the `live.json` response for STATION instead, with the credentials
+    (which the API echoes in service URLs) replaced by `APP_ID` and `APP_KEY`.
+
+    With `--benchmark [live.json ...]`, compare decoding whole responses with the streaming decoder on
+    saved responses, or on a generated large-station response if none are given.
     """
-    api = TrainDisplayBoardDecorator(TransportAPI(os.environ.get(
-        "TRANSPORTAPI_APP_ID"), os.environ.get("TRANSPORTAPI_APP_KEY")))
+    import sys
+    import tracemalloc
+
+    if sys.argv[1:2] == ['--benchmark']:
+        responses = [(path, open(path).read()) for path in sys.argv[2:]] or \
+            [('generated', _sample_response())]
+        board = TrainDisplayBoardDecorator(None)
+
+        def measure(decode, text, platform):
+            runs = 20
+            start = time.process_time()
+            for _ in range(runs):
+                payload = board.display_payload(decode(text), platform, 4)
+            cpu = (time.process_time() - start) / runs
+            tracemalloc.start()
+            board.display_payload(decode(text), platform, 4)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return payload, cpu, peak
+
+        for name, text in responses:
+            for platform in (None, '4'):
+                full, full_cpu, full_peak = measure(json.loads, text, platform)
+                streamed, cpu, peak = measure(decode_live_departures, text, platform)
+                assert full == streamed
+                print(f"{name} ({len(text) // 1024}KB, platform {platform}): "
+                      f"full {full_cpu * 1000:.2f}ms {full_peak // 1024}KB peak, "
+                      f"streamed {cpu * 1000:.2f}ms {peak // 1024}KB peak")
+        sys.exit()
+
+    app_id, app_key = os.environ.get("TRANSPORTAPI_APP_ID"), os.environ.get("TRANSPORTAPI_APP_KEY")
+    if sys.argv[1:2] == ['--record']:
+        text = TransportAPI(app_id, app_key).load_departures_text(sys.argv[2])
+        for secret, placeholder in ((app_id, 'APP_ID'), (app_key, 'APP_KEY')):
+            if secret:
+                text = text.replace(secret, placeholder)
+        print(text)
+        sys.exit()
+
+    api = TrainDisplayBoardDecorator(TransportAPI(app_id, app_key))
     data = api.load_departures_for_station('NCL', top=4)
     print(json.dumps(data, indent=2))
@@ -19,12 +19,12 @@ Required environment variables:
 - `TRANSPORTAPI_APP_KEY` - Transport API app key
 - `DEPATURE_STATION` - CRS code of station to show
 
-Data will be refreshed every 30 seconds.
+Data will be refreshed every 2 minutes. The board drops departed trains itself in between.
 """
 
 load_dotenv()
 
-REFRESH_INTERVAL_SECONDS = 30
+REFRESH_INTERVAL_SECONDS = 120
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
@@ -37,16 +37,28 @@ term.flush()
 
 controller = StageController(device)
 controller.add_stage(TrainDepartureBoardStage)
+controller.preload_fonts()
 
 api = TrainDisplayBoardDecorator(TransportAPI(os.environ.get(
     "TRANSPORTAPI_APP_ID"), os.environ.get("TRANSPORTAPI_APP_KEY")))
 
 
+last_event = None
+
+
 def load_data_and_update_display():
+    global last_event
     logger.info("Refreshing...")
     event = api.load_departures_for_station(
-        os.environ.get("DEPARTURE_STATION"), top=4)
-    controller.event_handler(event, None)
+        os.environ.get("DEPARTURE_STATION"), top=8)
+
+    # Only send the rows that changed since the last refresh. A patch is sent even when nothing
+    # changed, so the board knows its data is still fresh.
+    logger.info("Transport API cache: %s", api.api.cache_stats())
+
+    update = api.patch_payload(last_event, event)
+    if controller.submit(update):
+        last_event = event
 
     # Schedule refresh every `REFRESH_INTERVAL_SECONDS`
     Timer(REFRESH_INTERVAL_SECONDS, load_data_and_update_display).start()